@@ -5,20 +5,38 @@ All data is completely generic and suitable for public demonstrations
 """
 
 import os
+import re
 import json
 import asyncio
+import csv
+import hashlib
+import itertools
+import math
+import selectors
+import shutil
 import threading
 import time
 import uuid
+import zlib
+from types import MappingProxyType
+from collections import OrderedDict, deque
+from contextvars import ContextVar
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
-from fastapi import FastAPI, HTTPException, UploadFile, File, WebSocket, WebSocketDisconnect
+from typing import List, Dict, Any, Optional, Tuple, Callable, Awaitable
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
+import numpy as np
 import random
 from faker import Faker
 
+# Brotli is optional - without it responses fall back to gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 # Initialize
 app = FastAPI(title="ChatGPT UI Demo API", version="1.0.0")
 fake = Faker()
@@ -32,21 +50,730 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Response compression settings, overridable via environment
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_LEVEL = int(os.getenv("COMPRESSION_BROTLI_LEVEL", "4"))
+WS_PER_MESSAGE_DEFLATE = os.getenv("WS_PER_MESSAGE_DEFLATE", "true").lower() == "true"
+WS_COMPRESSION_LEVEL = int(os.getenv("WS_COMPRESSION_LEVEL", "6"))
+WS_COMPRESSION_MIN_SIZE = int(os.getenv("WS_COMPRESSION_MIN_SIZE", "512"))
+
+COMPRESSIBLE_CONTENT_TYPES = ("text/", "application/json", "application/javascript", "application/xml")
+
+class _Compressor:
+    """Streaming gzip/brotli compressor with a common interface"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_level: int):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_level)
+            self._zlib = None
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)  # 31 = gzip container
+
+    def compress(self, data: bytes) -> bytes:
+        if self._brotli:
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self._brotli:
+            return self._brotli.finish()
+        return self._zlib.flush(zlib.Z_FINISH)
+
+class CompressionMiddleware:
+    """Compress HTTP responses with brotli or gzip when the client accepts it.
+
+    Responses below minimum_size, with a non-text content type, or already
+    carrying a Content-Encoding are passed through untouched, so small
+    payloads don't pay the CPU cost.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE,
+                 gzip_level: int = COMPRESSION_GZIP_LEVEL, brotli_level: int = COMPRESSION_BROTLI_LEVEL):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_level = brotli_level
+
+    @staticmethod
+    def choose_encoding(accept_encoding: str) -> Optional[str]:
+        accepted = {}
+        for part in accept_encoding.split(","):
+            name, _, params = part.strip().partition(";")
+            quality = 1.0
+            params = params.strip()
+            if params.startswith("q="):
+                try:
+                    quality = float(params[2:])
+                except ValueError:
+                    quality = 0.0
+            accepted[name.strip().lower()] = quality
+        if brotli is not None and accepted.get("br", 0) > 0:
+            return "br"
+        if accepted.get("gzip", 0) > 0:
+            return "gzip"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope["headers"]}
+        encoding = self.choose_encoding(headers.get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            if passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                response_headers = {key.decode("latin-1").lower(): value.decode("latin-1")
+                                    for key, value in start_message["headers"]}
+                content_type = response_headers.get("content-type", "")
+                if ("content-encoding" in response_headers
+                        or not content_type.startswith(COMPRESSIBLE_CONTENT_TYPES)
+                        or (not more_body and len(body) < self.minimum_size)):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_level)
+                new_headers = [(key, value) for key, value in start_message["headers"]
+                               if key.lower() not in (b"content-length", b"vary")]
+                vary = response_headers.get("vary")
+                new_headers.append((b"vary", (f"{vary}, Accept-Encoding" if vary else "Accept-Encoding").encode("latin-1")))
+                new_headers.append((b"content-encoding", encoding.encode("latin-1")))
+
+                if not more_body:
+                    compressed = compressor.compress(body) + compressor.finish()
+                    new_headers.append((b"content-length", str(len(compressed)).encode("latin-1")))
+                    await send({**start_message, "headers": new_headers})
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                await send({**start_message, "headers": new_headers})
+
+            data = compressor.compress(body)
+            if not more_body:
+                data += compressor.finish()
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+app.add_middleware(CompressionMiddleware)
+
+def build_websocket_protocol():
+    """uvicorn WebSocket protocol with tuned permessage-deflate.
+
+    Uses WS_COMPRESSION_LEVEL instead of zlib's default and sends frames
+    smaller than WS_COMPRESSION_MIN_SIZE uncompressed (RSV1 unset), which
+    permessage-deflate allows per message.
+    """
+    from uvicorn.protocols.websockets.websockets_impl import WebSocketProtocol
+    from websockets import frames
+    from websockets.extensions.permessage_deflate import PerMessageDeflate, ServerPerMessageDeflateFactory
+
+    class ThresholdPerMessageDeflate(PerMessageDeflate):
+        def encode(self, frame: frames.Frame) -> frames.Frame:
+            if (frame.fin and frame.opcode in (frames.Opcode.TEXT, frames.Opcode.BINARY)
+                    and len(frame.data) < WS_COMPRESSION_MIN_SIZE):
+                return frame
+            return super().encode(frame)
+
+    class ThresholdDeflateFactory(ServerPerMessageDeflateFactory):
+        def process_request_params(self, params, accepted_extensions):
+            response_params, extension = super().process_request_params(params, accepted_extensions)
+            return response_params, ThresholdPerMessageDeflate(
+                extension.remote_no_context_takeover,
+                extension.local_no_context_takeover,
+                extension.remote_max_window_bits,
+                extension.local_max_window_bits,
+                extension.compress_settings,
+            )
+
+    class CompressedWebSocketProtocol(WebSocketProtocol):
+        extension_factory = ThresholdDeflateFactory
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            if self.config.ws_per_message_deflate:
+                self.available_extensions = [
+                    ThresholdDeflateFactory(compress_settings={"level": WS_COMPRESSION_LEVEL})
+                ]
+
+    return CompressedWebSocketProtocol
+
+# Time sources for the analysis pipeline
+class Clock:
+    """Wall-clock time source used by the analysis pipeline and progress logger"""
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    def time(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float) -> Awaitable:
+        return asyncio.sleep(seconds)
+
+class _VirtualTimeSelector(selectors.DefaultSelector):
+    """Selector that fast-forwards the virtual clock instead of blocking on timers"""
+
+    def __init__(self, clock: "VirtualClock"):
+        super().__init__()
+        self.clock = clock
+
+    def select(self, timeout=None):
+        # Waiting with no timers scheduled means we are waiting on real I/O
+        # (e.g. a thread handing results back), so block for real.
+        if timeout is None:
+            return super().select(None)
+        events = super().select(0)
+        if events or timeout <= 0:
+            return events
+        self.clock.advance(timeout)
+        return []
+
+class VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+    """Event loop whose timers run on a VirtualClock - sleeps complete instantly"""
+
+    def __init__(self, clock: "VirtualClock"):
+        super().__init__(_VirtualTimeSelector(clock))
+        self.clock = clock
+
+    def time(self) -> float:
+        return self.clock.time()
+
+class VirtualClock(Clock):
+    """Deterministic virtual time source for tests and capacity simulations.
+
+    Time only moves when every task on the loop is waiting on a timer, and it
+    jumps straight to the next deadline. Coroutines must be driven through
+    run() so that asyncio.sleep (and anything built on loop timers) uses
+    virtual time too.
+    """
+
+    def __init__(self, start: Optional[datetime] = None):
+        self.start = start or datetime(2024, 1, 1)
+        self._time = 0.0
+
+    def now(self) -> datetime:
+        return self.start + timedelta(seconds=self._time)
+
+    def time(self) -> float:
+        return self._time
+
+    def advance(self, seconds: float):
+        self._time += seconds
+
+    def run(self, coro):
+        """Run a coroutine to completion on a virtual-time event loop"""
+        loop = VirtualTimeEventLoop(self)
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.close()
+
+class StepDelayProfile:
+    """Per-step latency model for the simulated analysis pipeline"""
+
+    def __init__(self, default: float = 0.5, overrides: Optional[Dict[str, float]] = None,
+                 jitter: float = 0.0, seed: Optional[int] = None):
+        self.default = default
+        self.overrides = overrides or {}
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+
+    def delay_for(self, step: str) -> float:
+        """Delay in seconds for a step, with optional +/- jitter as a fraction of the base"""
+        delay = self.overrides.get(step, self.default)
+        if self.jitter:
+            delay *= 1 + self._rng.uniform(-self.jitter, self.jitter)
+        return max(0.0, delay)
+
+system_clock = Clock()
+
+# 3 seconds total / 6 steps = 0.5 seconds per step
+default_step_delays = StepDelayProfile(default=0.5)
+
+# WebSocket connection settings - intervals in seconds, overridable via environment
+WS_PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", "20"))
+WS_PONG_TIMEOUT = float(os.getenv("WS_PONG_TIMEOUT", "20"))  # 0 disables reaping
+WS_CLOSE_ON_COMPLETE = os.getenv("WS_CLOSE_ON_COMPLETE", "true").lower() == "true"
+WS_MAX_CONNECTIONS_PER_SESSION = int(os.getenv("WS_MAX_CONNECTIONS_PER_SESSION", "4"))
+WS_MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", "10000"))
+WS_BATCH_WINDOW = float(os.getenv("WS_BATCH_WINDOW", "0.05"))
+WS_MAX_BATCH_WINDOW = 1.0
+
+# Entries after which a session's job has nothing more to report
+TERMINAL_STEPS = ("Finished", "Error")
+
+class ProgressConnection:
+    """A client WebSocket subscribed to one session's progress updates.
+
+    Clients that negotiate framing="batch" receive progress entries as JSON
+    array frames: entries produced within batch_window seconds of each other
+    are coalesced into one frame. Control frames (pings) are always sent
+    as single objects.
+    """
+
+    def __init__(self, websocket: WebSocket, session_id: str, clock: Clock,
+                 framing: str = "single", batch_window: float = 0.0):
+        self.websocket = websocket
+        self.session_id = session_id
+        self.clock = clock
+        self.framing = framing
+        self.batch_window = batch_window
+        self.last_seen = clock.time()
+        self.closed = asyncio.Event()
+        self._pending: List[str] = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+    @property
+    def batched(self) -> bool:
+        return self.framing == "batch"
+
+    def touch(self):
+        self.last_seen = self.clock.time()
+
+    def idle_for(self) -> float:
+        return self.clock.time() - self.last_seen
+
+    async def send_text(self, text: str):
+        await self.websocket.send_text(text)
+
+    async def send_entries(self, entries: List[str]):
+        """Send already-serialized progress entries in this connection's framing"""
+        if not entries:
+            return
+        if self.batched:
+            await self.send_text("[" + ",".join(entries) + "]")
+        else:
+            for entry in entries:
+                await self.send_text(entry)
+
+    async def send_entry(self, entry: str):
+        if not self.batched:
+            await self.send_text(entry)
+            return
+        self._pending.append(entry)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_after_window())
+
+    async def _flush_after_window(self):
+        await asyncio.sleep(self.batch_window)
+        self._flush_task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"Error sending WebSocket message: {e}")
+            self.closed.set()
+
+    async def flush(self):
+        pending, self._pending = self._pending, []
+        await self.send_entries(pending)
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        try:
+            await self.flush()
+            await self.websocket.close(code=code, reason=reason)
+        except Exception as e:
+            print(f"Error closing WebSocket: {e}")
+
+# Progress log compaction and retention settings, overridable via environment
+LOG_COMPACTION_INTERVAL = float(os.getenv("LOG_COMPACTION_INTERVAL", "60"))
+LOG_COMPACT_AFTER = float(os.getenv("LOG_COMPACT_AFTER", "300"))  # seconds since a finished log was last written
+LOG_COMPACTION_BATCH = int(os.getenv("LOG_COMPACTION_BATCH", "5000"))
+LOG_SEGMENT_MAX_BYTES = int(os.getenv("LOG_SEGMENT_MAX_BYTES", str(64 * 1024 * 1024)))
+LOG_SEGMENT_MAX_AGE = float(os.getenv("LOG_SEGMENT_MAX_AGE", "86400"))  # seconds before a new segment is started
+LOG_RETENTION_DAYS = float(os.getenv("LOG_RETENTION_DAYS", "30"))
+LOG_RETENTION_MAX_BYTES = int(os.getenv("LOG_RETENTION_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+class LogSegmentStore:
+    """Packed storage for finished sessions' progress logs.
+
+    Each segment-NNNNNN.jsonl holds one {"session_id", "logs"} record per
+    line; a matching .idx file records (session_id, offset, length) for each
+    record plus tombstones for removed sessions. The in-memory index is
+    rebuilt from the .idx files on startup and serves point lookups with a
+    single seek and read. A segment is closed once it reaches
+    max_segment_bytes or spans max_segment_age seconds, so retention can drop
+    whole segments, oldest first, by the time of their newest record.
+    """
+
+    def __init__(self, segments_dir: str, max_segment_bytes: int = LOG_SEGMENT_MAX_BYTES,
+                 max_segment_age: float = LOG_SEGMENT_MAX_AGE):
+        self.segments_dir = segments_dir
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age = max_segment_age
+        self._index: Dict[str, Tuple[int, int, int]] = {}  # session_id -> (segment, offset, length)
+        self._packed_range: Dict[int, Tuple[float, float]] = {}  # segment -> (oldest, newest) packed_at
+        self._lock = threading.Lock()
+        os.makedirs(self.segments_dir, exist_ok=True)
+        self._segments = self._list_segments()
+        self._load_index()
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.segments_dir, f"segment-{segment:06d}.jsonl")
+
+    def _index_path(self, segment: int) -> str:
+        return os.path.join(self.segments_dir, f"segment-{segment:06d}.idx")
+
+    def _list_segments(self) -> List[int]:
+        segments = []
+        for name in os.listdir(self.segments_dir):
+            if name.startswith("segment-") and name.endswith(".jsonl"):
+                segments.append(int(name[len("segment-"):-len(".jsonl")]))
+        return sorted(segments)
+
+    def _load_index(self):
+        for segment in self._segments:
+            index_path = self._index_path(segment)
+            if not os.path.exists(index_path):
+                continue
+            with open(index_path, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn final line from a crash
+                    if record.get("deleted"):
+                        self._index.pop(record["session_id"], None)
+                    else:
+                        self._index[record["session_id"]] = (segment, record["offset"], record["length"])
+                        # Older index lines have no packed_at; the segment's mtime is the best guess
+                        self._note_packed(segment, record.get("packed_at") or
+                                          os.path.getmtime(self._segment_path(segment)))
+
+    def _note_packed(self, segment: int, packed_at: float):
+        oldest, newest = self._packed_range.get(segment, (packed_at, packed_at))
+        self._packed_range[segment] = (min(oldest, packed_at), max(newest, packed_at))
+
+    def _current_segment(self) -> int:
+        if self._segments:
+            last = self._segments[-1]
+            oldest = self._packed_range.get(last, (time.time(), 0))[0]
+            if (os.path.getsize(self._segment_path(last)) < self.max_segment_bytes
+                    and time.time() - oldest < self.max_segment_age):
+                return last
+        self._segments.append(self._segments[-1] + 1 if self._segments else 1)
+        return self._segments[-1]
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._index
+
+    def append(self, records: List[Tuple[str, List[Dict]]]):
+        """Pack (session_id, logs) records into the current segment"""
+        if not records:
+            return
+        with self._lock:
+            segment = self._current_segment()
+            packed_at = time.time()
+            index_lines = []
+            with open(self._segment_path(segment), 'ab') as f:
+                for session_id, logs in records:
+                    data = (json.dumps({"session_id": session_id, "logs": logs}) + "\n").encode("utf-8")
+                    offset = f.tell()
+                    f.write(data)
+                    self._index[session_id] = (segment, offset, len(data))
+                    index_lines.append(json.dumps({"session_id": session_id, "offset": offset,
+                                                   "length": len(data), "packed_at": packed_at}))
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._index_path(segment), 'a') as f:
+                f.write("\n".join(index_lines) + "\n")
+            self._note_packed(segment, packed_at)
+
+    def read(self, session_id: str) -> Optional[List[Dict]]:
+        location = self._index.get(session_id)
+        if location is None:
+            return None
+        segment, offset, length = location
+        try:
+            with open(self._segment_path(segment), 'rb') as f:
+                f.seek(offset)
+                return json.loads(f.read(length))["logs"]
+        except Exception as e:
+            print(f"Error reading log segment: {e}")
+            return None
+
+    def remove(self, session_id: str):
+        with self._lock:
+            location = self._index.pop(session_id, None)
+            if location is None:
+                return
+            # The tombstone goes next to the record it hides, so it is read back
+            # (and dropped by retention) together with it
+            with open(self._index_path(location[0]), 'a') as f:
+                f.write(json.dumps({"session_id": session_id, "deleted": True}) + "\n")
+
+    def _segment_bytes(self, segment: int) -> int:
+        total = 0
+        for path in (self._segment_path(segment), self._index_path(segment)):
+            if os.path.exists(path):
+                total += os.path.getsize(path)
+        return total
+
+    def enforce_retention(self, max_age: float, max_total_bytes: int) -> int:
+        """Drop segments whose newest record is more than max_age seconds old, then
+        the oldest ones until the total fits in max_total_bytes. Returns segments dropped."""
+        with self._lock:
+            now = time.time()
+            sizes = {segment: self._segment_bytes(segment) for segment in self._segments}
+            total = sum(sizes.values())
+            dropped = []
+            for segment in list(self._segments):
+                newest = self._packed_range.get(segment, (0, os.path.getmtime(self._segment_path(segment))))[1]
+                expired = now - newest > max_age
+                if not expired and total <= max_total_bytes:
+                    break
+                dropped.append(segment)
+                total -= sizes[segment]
+            for segment in dropped:
+                self._segments.remove(segment)
+                self._packed_range.pop(segment, None)
+                for path in (self._segment_path(segment), self._index_path(segment)):
+                    if os.path.exists(path):
+                        os.remove(path)
+            if dropped:
+                dropped_set = set(dropped)
+                self._index = {session_id: location for session_id, location in self._index.items()
+                               if location[0] not in dropped_set}
+            return len(dropped)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "segments": len(self._segments),
+                "sessions": len(self._index),
+                "bytes": sum(self._segment_bytes(segment) for segment in self._segments)
+            }
+
+PROGRESS_INDEX_MAX_ENTRIES = int(os.getenv("PROGRESS_INDEX_MAX_ENTRIES", "100000"))
+MAX_PROGRESS_QUERY_LIMIT = 1000
+
+def entry_status(step: str) -> str:
+    """Coarse status of a progress entry, used for filtering"""
+    if step == "Error":
+        return "error"
+    if step == "Finished":
+        return "finished"
+    return "running"
+
+class DurationStats:
+    """Streaming duration summary: count, mean, min, max and approximate percentiles.
+
+    Durations are counted in log-spaced buckets (each ~5% wider than the
+    last), so memory stays constant and percentiles are within ~5%.
+    """
+
+    GROWTH = 1.05
+    RESOLUTION = 0.001  # seconds; anything shorter shares the first bucket
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.buckets: Dict[int, int] = {}
+
+    def add(self, seconds: float):
+        seconds = max(seconds, 0.0)
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        bucket = 0 if seconds <= self.RESOLUTION else math.ceil(math.log(seconds / self.RESOLUTION, self.GROWTH))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                upper = self.RESOLUTION * self.GROWTH ** bucket
+                return min(max(upper, self.min), self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": self.total / self.count,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99)
+        }
+
+class ProgressIndex:
+    """In-memory index over recently logged progress entries.
+
+    Entries are kept in log order with secondary indexes by step, status and
+    session, so filtered queries touch only matching entries and time range
+    queries stop at the first entry older than `since`. The oldest entries
+    are evicted past max_entries. Step durations are aggregated as they are
+    recorded and are not affected by eviction.
+    """
+
+    def __init__(self, max_entries: int = PROGRESS_INDEX_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, Tuple[datetime, Dict]]" = OrderedDict()
+        self._by_step: Dict[str, deque] = {}
+        self._by_status: Dict[str, deque] = {}
+        self._by_session: Dict[str, deque] = {}
+        self._seq = 0
+        self._session_started: Dict[str, datetime] = {}
+        self.step_durations: Dict[str, DurationStats] = {}
+        self.session_durations = DurationStats()
+        # The query endpoint runs on the event loop, session deletion in a worker thread
+        self._lock = threading.Lock()
+
+    def add(self, entry: Dict, logged_at: datetime):
+        session_id = entry["session_id"]
+        step = entry["step"]
+        with self._lock:
+            self._seq += 1
+            self._entries[self._seq] = (logged_at, entry)
+            for index, key in ((self._by_step, step), (self._by_status, entry_status(step)),
+                               (self._by_session, session_id)):
+                index.setdefault(key, deque()).append(self._seq)
+
+            # End-to-end duration runs from "Starting" to the terminal step
+            if step == "Starting":
+                self._session_started[session_id] = logged_at
+            elif step in TERMINAL_STEPS and session_id in self._session_started:
+                started = self._session_started.pop(session_id)
+                self.session_durations.add((logged_at - started).total_seconds())
+
+            while len(self._entries) > self.max_entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._prune(self._by_step, evicted["step"])
+                self._prune(self._by_status, entry_status(evicted["step"]))
+                if not self._prune(self._by_session, evicted["session_id"]):
+                    self._session_started.pop(evicted["session_id"], None)
+
+    def _prune(self, index: Dict[str, deque], key: str) -> bool:
+        """Drop evicted or removed entries from the head of one index list.
+        Returns whether any entries are left under the key."""
+        seqs = index.get(key)
+        while seqs and seqs[0] not in self._entries:
+            seqs.popleft()
+        if seqs is not None and not seqs:
+            del index[key]
+        return bool(seqs)
+
+    def record_step_duration(self, step: str, seconds: float):
+        with self._lock:
+            self.step_durations.setdefault(step, DurationStats()).add(seconds)
+
+    def remove_session(self, session_id: str):
+        with self._lock:
+            for seq in self._by_session.pop(session_id, ()):
+                self._entries.pop(seq, None)
+            self._session_started.pop(session_id, None)
+
+    def query(self, step: Optional[str] = None, status: Optional[str] = None,
+              session_id: Optional[str] = None, since: Optional[datetime] = None,
+              until: Optional[datetime] = None, limit: int = 100) -> Tuple[List[Dict], bool]:
+        """Matching entries, newest first, and whether more than `limit` matched"""
+        with self._lock:
+            candidates = None
+            for index, key in ((self._by_step, step), (self._by_status, status),
+                               (self._by_session, session_id)):
+                if key is None:
+                    continue
+                seqs = index.get(key)
+                if not seqs:
+                    return [], False
+                if candidates is None or len(seqs) < len(candidates):
+                    candidates = seqs
+            seqs = reversed(candidates) if candidates is not None else reversed(self._entries)
+
+            matches = []
+            for seq in seqs:
+                record = self._entries.get(seq)
+                if record is None:
+                    continue
+                logged_at, entry = record
+                if since is not None and logged_at < since:
+                    break
+                if until is not None and logged_at > until:
+                    continue
+                if step is not None and entry["step"] != step:
+                    continue
+                if status is not None and entry_status(entry["step"]) != status:
+                    continue
+                if session_id is not None and entry["session_id"] != session_id:
+                    continue
+                if len(matches) == limit:
+                    return matches, True
+                matches.append(entry)
+            return matches, False
+
+    def duration_summary(self, step: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            steps = {name: stats.summary() for name, stats in self.step_durations.items()
+                     if step is None or name == step}
+            return {"steps": steps, "end_to_end": self.session_durations.summary()}
+
 # Progress logging system
 class ProgressLogger:
-    def __init__(self):
-        self.logs_dir = "logs"
-        self.active_connections: Dict[str, WebSocket] = {}
+    def __init__(self, logs_dir: Optional[str] = "logs", clock: Optional[Clock] = None):
+        # logs_dir=None keeps logs in memory only (used by capacity simulations)
+        self.logs_dir = logs_dir
+        self.clock = clock or system_clock
+        self.active_connections: Dict[str, List[ProgressConnection]] = {}
+        self._connection_count = 0
         self.session_progress: Dict[str, List[Dict]] = {}
         self.session_notifications: Dict[str, Dict] = {}
-        os.makedirs(self.logs_dir, exist_ok=True)
+        self.index = ProgressIndex()
+        self.segments: Optional[LogSegmentStore] = None
+        # Serializes live log file writes and in-memory eviction with the compactor thread
+        self._files_lock = threading.Lock()
+        if self.logs_dir:
+            os.makedirs(self.logs_dir, exist_ok=True)
+            self.segments = LogSegmentStore(os.path.join(self.logs_dir, "segments"))
     
-    def get_log_file_path(self, session_id: str) -> str:
+    def get_log_file_path(self, session_id: str) -> Optional[str]:
+        if not self.logs_dir:
+            return None
         return os.path.join(self.logs_dir, f"{session_id}_progress.json")
     
-    async def log_progress(self, session_id: str, step: str, message: str, step_number: int = None, total_steps: int = None):
-        """Log progress step and notify connected clients"""
-        timestamp = datetime.now().isoformat()
+    async def log_progress(self, session_id: str, step: str, message: str, step_number: int = None, total_steps: int = None,
+                           details: Optional[Dict[str, Any]] = None):
+        """Log progress step and notify connected clients. `details` adds extra fields to the entry."""
+        logged_at = self.clock.now()
+        timestamp = logged_at.isoformat()
         
         log_entry = {
             "timestamp": timestamp,
@@ -56,45 +783,99 @@ class ProgressLogger:
             "total_steps": total_steps,
             "session_id": session_id
         }
+        if details:
+            log_entry.update(details)
         
-        # Store in memory for active sessions
-        if session_id not in self.session_progress:
-            self.session_progress[session_id] = []
-        self.session_progress[session_id].append(log_entry)
+        # Store in memory for active sessions, picking up history from disk
+        # if the session already logged before (e.g. a follow-up query). The
+        # compactor thread evicts packed sessions under the same lock.
+        with self._files_lock:
+            if session_id not in self.session_progress:
+                self.session_progress[session_id] = list(self.get_progress_logs(session_id))
+            self.session_progress[session_id].append(log_entry)
+        self.index.add(log_entry, logged_at)
         
         # Write to file
         log_file = self.get_log_file_path(session_id)
-        try:
-            # Read existing logs
-            existing_logs = []
-            if os.path.exists(log_file):
-                with open(log_file, 'r') as f:
-                    existing_logs = json.load(f)
-            
-            # Append new log
-            existing_logs.append(log_entry)
-            
-            # Write back
-            with open(log_file, 'w') as f:
-                json.dump(existing_logs, f, indent=2)
-        except Exception as e:
-            print(f"Error writing log file: {e}")
+        if log_file:
+            try:
+                with self._files_lock:
+                    # Read existing logs - a compacted session moves back to a live file
+                    existing_logs = []
+                    compacted = False
+                    if os.path.exists(log_file):
+                        with open(log_file, 'r') as f:
+                            existing_logs = json.load(f)
+                    elif session_id in self.segments:
+                        existing_logs = self.segments.read(session_id) or []
+                        compacted = True
+                    
+                    # Append new log
+                    existing_logs.append(log_entry)
+                    
+                    # Write back
+                    with open(log_file, 'w') as f:
+                        json.dump(existing_logs, f, indent=2)
+                    if compacted:
+                        self.segments.remove(session_id)
+            except Exception as e:
+                print(f"Error writing log file: {e}")
         
         # Send to connected WebSocket clients
-        if session_id in self.active_connections:
+        if self.active_connections.get(session_id):
+            await self.broadcast(session_id, json.dumps(log_entry))
+        
+        # Nothing more will be reported for this job - free the connections
+        if step in TERMINAL_STEPS and WS_CLOSE_ON_COMPLETE:
+            await self.close_connections(session_id, reason="Job complete")
+    
+    def connection_count(self) -> int:
+        return self._connection_count
+    
+    def connection_limit_reason(self, session_id: str) -> Optional[str]:
+        """Reason a new connection for the session would exceed the limits, if any"""
+        if self.connection_count() >= WS_MAX_CONNECTIONS:
+            return "Too many connections"
+        if len(self.active_connections.get(session_id, [])) >= WS_MAX_CONNECTIONS_PER_SESSION:
+            return "Too many connections for this session"
+        return None
+    
+    def register_connection(self, session_id: str, websocket: WebSocket,
+                            framing: str = "single", batch_window: float = 0.0) -> ProgressConnection:
+        connection = ProgressConnection(websocket, session_id, self.clock, framing, batch_window)
+        self.active_connections.setdefault(session_id, []).append(connection)
+        self._connection_count += 1
+        return connection
+    
+    def unregister_connection(self, connection: ProgressConnection):
+        connections = self.active_connections.get(connection.session_id, [])
+        if connection in connections:
+            connections.remove(connection)
+            self._connection_count -= 1
+        # Keep "session_id in active_connections" meaning someone is watching
+        if not connections:
+            self.active_connections.pop(connection.session_id, None)
+    
+    async def broadcast(self, session_id: str, text: str):
+        """Send a frame to every connection watching the session, dropping failed ones"""
+        for connection in list(self.active_connections.get(session_id, [])):
             try:
-                await self.active_connections[session_id].send_text(json.dumps(log_entry))
+                await connection.send_entry(text)
             except Exception as e:
                 print(f"Error sending WebSocket message: {e}")
                 # Remove failed connection
-                if session_id in self.active_connections:
-                    del self.active_connections[session_id]
+                self.unregister_connection(connection)
+                connection.closed.set()
+    
+    async def close_connections(self, session_id: str, code: int = 1000, reason: str = ""):
+        for connection in list(self.active_connections.get(session_id, [])):
+            await connection.close(code=code, reason=reason)
     
     def add_notification(self, session_id: str, message: str):
         """Add notification for completed responses in background"""
         self.session_notifications[session_id] = {
             "message": message,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": self.clock.now().isoformat(),
             "read": False
         }
     
@@ -115,23 +896,119 @@ class ProgressLogger:
         
         # Fall back to file
         log_file = self.get_log_file_path(session_id)
-        if os.path.exists(log_file):
+        if log_file and os.path.exists(log_file):
             try:
                 with open(log_file, 'r') as f:
                     return json.load(f)
             except Exception as e:
                 print(f"Error reading log file: {e}")
         
+        # Fall back to compacted segments
+        if self.segments is not None:
+            return self.segments.read(session_id) or []
+        
         return []
+    
+    def delete_logs(self, session_id: str):
+        """Forget a session's progress logs everywhere they are stored"""
+        self.session_progress.pop(session_id, None)
+        self.session_notifications.pop(session_id, None)
+        self.index.remove_session(session_id)
+        log_file = self.get_log_file_path(session_id)
+        if not log_file:
+            return
+        with self._files_lock:
+            if os.path.exists(log_file):
+                try:
+                    os.remove(log_file)
+                except Exception as e:
+                    print(f"Error removing log file: {e}")
+        self.segments.remove(session_id)
+    
+    def compact(self, min_age: float = LOG_COMPACT_AFTER, batch_size: int = LOG_COMPACTION_BATCH,
+                retention_age: float = LOG_RETENTION_DAYS * 86400,
+                retention_bytes: int = LOG_RETENTION_MAX_BYTES) -> Dict[str, int]:
+        """Pack finished sessions' log files into segments and apply retention.
+
+        Blocking file I/O - run it off the event loop (see run_log_compactor).
+        Only files whose last entry is terminal and that haven't been written
+        for min_age seconds are packed; live files past the retention age are
+        deleted outright so abandoned sessions don't linger either.
+        """
+        if not self.logs_dir:
+            return {"compacted": 0, "expired": 0, "segments_dropped": 0}
+        now = time.time()
+        candidates = []
+        expired = 0
+        with os.scandir(self.logs_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith("_progress.json") or not entry.is_file():
+                    continue
+                age = now - entry.stat().st_mtime
+                if age > retention_age:
+                    with self._files_lock:
+                        os.remove(entry.path)
+                    expired += 1
+                elif age >= min_age and len(candidates) < batch_size:
+                    candidates.append(entry)
+        
+        records = []
+        packed_files = []
+        for entry in candidates:
+            session_id = entry.name[:-len("_progress.json")]
+            with self._files_lock:
+                try:
+                    stat = os.stat(entry.path)
+                    with open(entry.path, 'r') as f:
+                        logs = json.load(f)
+                except Exception as e:
+                    print(f"Error reading log file: {e}")
+                    continue
+            if logs and logs[-1]["step"] in TERMINAL_STEPS:
+                records.append((session_id, logs))
+                packed_files.append((session_id, entry.path, stat.st_mtime_ns, stat.st_size))
+        self.segments.append(records)
+        
+        compacted = 0
+        for session_id, path, mtime_ns, size in packed_files:
+            with self._files_lock:
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    # Session deleted meanwhile
+                    self.segments.remove(session_id)
+                    continue
+                if (stat.st_mtime_ns, stat.st_size) != (mtime_ns, size):
+                    # Session logged again while we were packing - the live file wins
+                    self.segments.remove(session_id)
+                    continue
+                os.remove(path)
+                self.session_progress.pop(session_id, None)
+                compacted += 1
+        
+        dropped = self.segments.enforce_retention(retention_age, retention_bytes)
+        return {"compacted": compacted, "expired": expired, "segments_dropped": dropped}
 
 # Global progress logger instance
 progress_logger = ProgressLogger()
 
+async def run_log_compactor(interval: float = LOG_COMPACTION_INTERVAL):
+    """Background loop packing finished progress logs into segments"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            result = await asyncio.to_thread(progress_logger.compact)
+            if result["compacted"] or result["expired"] or result["segments_dropped"]:
+                print(f"Log compaction: {result}")
+        except Exception as e:
+            print(f"Error compacting progress logs: {e}")
+
 # Pydantic models
 class QueryRequest(BaseModel):
     user_query: str
     user_email: str
     session_id: Optional[str] = None
+    file_id: Optional[str] = None  # an uploaded CSV to answer from
 
 class QueryResponse(BaseModel):
     session_id: str
@@ -151,45 +1028,1542 @@ class SessionInfo(BaseModel):
     status: str
     has_notification: bool = False
 
+class BlobStore:
+    """Content-addressed, refcounted store for large message payloads.
+
+    Identical response texts and chart specs are kept once, keyed by the
+    SHA-256 of their canonical JSON, and shared by every message that
+    references them. Blobs live in memory, like the sessions that reference
+    them, and are dropped when the last reference goes away.
+    Stored values are shared - callers must not mutate what get() returns.
+    """
+
+    def __init__(self):
+        self._blobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.logical_bytes = 0
+
+    @staticmethod
+    def encode(value: Any) -> bytes:
+        return json.dumps(value, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+    def put(self, value: Any) -> str:
+        """Store a value (or add a reference to an identical one) and return its key"""
+        data = self.encode(value)
+        key = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            blob = self._blobs.get(key)
+            if blob:
+                blob["refs"] += 1
+            else:
+                blob = self._blobs[key] = {"value": value, "refs": 1, "size": len(data)}
+            self.logical_bytes += blob["size"]
+        return key
+
+    def get(self, key: str) -> Any:
+        blob = self._blobs.get(key)
+        if blob:
+            return blob["value"]
+        raise KeyError(key)
+
+    def release(self, key: str):
+        """Drop one reference; the blob is deleted with its last reference"""
+        with self._lock:
+            blob = self._blobs.get(key)
+            if not blob:
+                return
+            blob["refs"] -= 1
+            self.logical_bytes -= blob["size"]
+            if blob["refs"] > 0:
+                return
+            del self._blobs[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stored_bytes = sum(blob["size"] for blob in self._blobs.values())
+            references = sum(blob["refs"] for blob in self._blobs.values())
+            blobs = len(self._blobs)
+            logical_bytes = self.logical_bytes
+        return {
+            "blobs": blobs,
+            "references": references,
+            "stored_bytes": stored_bytes,
+            "logical_bytes": logical_bytes,
+            "saved_bytes": logical_bytes - stored_bytes,
+            "dedup_ratio": round(logical_bytes / stored_bytes, 2) if stored_bytes else 1.0
+        }
+
+# Query result cache settings, overridable via environment
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "300"))
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "1000"))
+# File exports carry a per-request download link, so they are never shared
+UNCACHED_RESPONSE_TYPES = ("file",)
+
+class QueryResultCache:
+    """TTL and size-bounded LRU cache of generated responses.
+
+    Keys are the normalized query (case, whitespace and punctuation
+    insensitive) plus the resolved response and chart type, so trivially
+    different phrasings from different users share one analysis run.
+    """
+
+    def __init__(self, max_entries: int = QUERY_CACHE_MAX_ENTRIES, ttl: float = QUERY_CACHE_TTL,
+                 clock: Optional[Clock] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock or system_clock
+        self._entries: "OrderedDict[Tuple, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def normalize_query(user_query: str) -> str:
+        words = re.sub(r"[^\w\s]", " ", user_query.lower()).split()
+        return " ".join(words)
+
+    def make_key(self, user_query: str, response_type: str, file_id: Optional[str] = None) -> Tuple:
+        chart_type = determine_chart_type(user_query) if response_type == "chart" else None
+        return (self.normalize_query(user_query), response_type, chart_type, file_id)
+
+    def get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, result = entry
+            if self.clock.time() >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: Tuple, result: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = (self.clock.time() + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_query: Optional[str] = None) -> int:
+        """Drop every cached result for a query (any response type), or everything if no query"""
+        with self._lock:
+            if user_query is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                return removed
+            normalized = self.normalize_query(user_query)
+            keys = [key for key in self._entries if key[0] == normalized]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+# Global query result cache
+query_cache = QueryResultCache()
+
+# Per-user rate limits and job scheduling, overridable via environment
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "30"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "10"))
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "32"))
+MAX_JOBS_PER_USER = int(os.getenv("MAX_JOBS_PER_USER", "5"))
+MAX_ACTIVE_SESSIONS_PER_USER = int(os.getenv("MAX_ACTIVE_SESSIONS_PER_USER", "3"))
+MAX_BULK_JOBS = int(os.getenv("MAX_BULK_JOBS", "8"))
+MIN_BULK_JOBS = int(os.getenv("MIN_BULK_JOBS", "1"))  # slots bulk jobs get back first when they're waiting
+BULK_JOBS_YIELD = os.getenv("BULK_JOBS_YIELD", "true").lower() == "true"
+JOB_LANES = ("interactive", "bulk")  # in dispatch priority order
+
+class TokenBucketRateLimiter:
+    """Per-key token buckets refilling at `rate` tokens per second up to `burst`"""
+
+    def __init__(self, rate: float, burst: int, clock: Optional[Clock] = None, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock or system_clock
+        self.max_keys = max_keys
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def _tokens(self, key: str, now: float) -> float:
+        tokens, updated_at = self._buckets.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - updated_at) * self.rate)
+
+    def try_acquire(self, key: str) -> float:
+        """Take a token for key. Returns 0 on success, otherwise seconds until one is available."""
+        with self._lock:
+            now = self.clock.time()
+            tokens = self._tokens(key, now)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                if len(self._buckets) > self.max_keys:
+                    self._prune(now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def _prune(self, now: float):
+        # A full bucket is indistinguishable from a missing one
+        for key in [key for key in self._buckets if self._tokens(key, now) >= self.burst]:
+            del self._buckets[key]
+
+class SchedulerLimitError(Exception):
+    """A job was refused because its user is over a scheduling limit"""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+class JobTicket:
+    """A dispatched job's claim on a scheduler slot"""
+
+    def __init__(self, user: str, session_id: str, lane: str):
+        self.user = user
+        self.session_id = session_id
+        self.lane = lane
+        self.holding_slot = False
+        self.resume: Optional[asyncio.Future] = None
+        # Concurrent pipeline steps of one job must not give up its slot twice
+        self.lock = asyncio.Lock()
+
+# The ticket of the job the current task belongs to, for yield_point()
+current_job: ContextVar[Optional[JobTicket]] = ContextVar("current_job", default=None)
+
+def job_lane_for(response_type: str) -> str:
+    """Heavy file exports run in the bulk lane; everything else is interactive"""
+    return "bulk" if response_type == "file" else "interactive"
+
+class FairJobScheduler:
+    """Runs background jobs with a global concurrency cap, round-robin across users.
+
+    Jobs run in priority lanes - "interactive" before "bulk" - and each lane
+    has its own concurrency limit within the global cap. While bulk jobs are
+    waiting, freed slots go to them first until min_bulk_jobs are running
+    (one slot is always left for interactive jobs), so a steady stream of
+    interactive work can't starve bulk work. Within a lane each
+    user has a FIFO queue; whenever a slot frees up the next user in turn
+    gets to start one job and goes to the back of the line, so one user's
+    backlog can't starve everyone else. Per-user limits cap queued plus
+    running jobs (across lanes) and the number of sessions with outstanding
+    work.
+
+    With bulk_yields, a running bulk job that reaches a yield_point() while
+    interactive jobs wait for a slot hands its slot over and waits to get
+    one back, ahead of bulk jobs that haven't started yet.
+    """
+
+    def __init__(self, max_concurrent_jobs: int = MAX_CONCURRENT_JOBS,
+                 max_jobs_per_user: int = MAX_JOBS_PER_USER,
+                 max_sessions_per_user: int = MAX_ACTIVE_SESSIONS_PER_USER,
+                 max_bulk_jobs: int = MAX_BULK_JOBS,
+                 bulk_yields: bool = BULK_JOBS_YIELD,
+                 min_bulk_jobs: int = MIN_BULK_JOBS):
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.max_jobs_per_user = max_jobs_per_user
+        self.max_sessions_per_user = max_sessions_per_user
+        self.lane_limits = {"interactive": max_concurrent_jobs, "bulk": max_bulk_jobs}
+        self.min_bulk_jobs = max(0, min(min_bulk_jobs, max_bulk_jobs, max_concurrent_jobs - 1))
+        self.bulk_yields = bulk_yields
+        self._queues: Dict[str, Dict[str, deque]] = {lane: {} for lane in JOB_LANES}
+        self._turns: Dict[str, deque] = {lane: deque() for lane in JOB_LANES}
+        self._running = 0
+        self._lane_running = {lane: 0 for lane in JOB_LANES}
+        self._paused: deque = deque()  # bulk tickets that yielded their slot
+        self._user_jobs: Dict[str, int] = {}
+        self._user_sessions: Dict[str, Dict[str, int]] = {}
+        self._tasks = set()
+        self.accepting = True
+        self.yields = 0
+
+    def check_limits(self, user: str, session_id: str):
+        if not self.accepting:
+            raise SchedulerLimitError("shutting_down", "The server is restarting, please try again shortly")
+        if self._user_jobs.get(user, 0) >= self.max_jobs_per_user:
+            raise SchedulerLimitError("too_many_jobs",
+                                      f"You already have {self.max_jobs_per_user} requests in progress")
+        active_sessions = self._user_sessions.get(user, {})
+        if session_id not in active_sessions and len(active_sessions) >= self.max_sessions_per_user:
+            raise SchedulerLimitError("too_many_sessions",
+                                      f"You already have {self.max_sessions_per_user} conversations in progress")
+
+    def submit(self, user: str, session_id: str, job_factory: Callable[[], Awaitable],
+               lane: str = "interactive"):
+        """Queue a job (a coroutine function) for user in a lane; it starts when the user's turn comes up"""
+        if lane not in JOB_LANES:
+            raise ValueError(f"Unknown job lane '{lane}'")
+        self.check_limits(user, session_id)
+        self._user_jobs[user] = self._user_jobs.get(user, 0) + 1
+        user_sessions = self._user_sessions.setdefault(user, {})
+        user_sessions[session_id] = user_sessions.get(session_id, 0) + 1
+        queues = self._queues[lane]
+        if user not in queues:
+            queues[user] = deque()
+            self._turns[lane].append(user)
+        queues[user].append((session_id, job_factory))
+        self._dispatch()
+
+    def _can_start(self, lane: str) -> bool:
+        return self._running < self.max_concurrent_jobs and self._lane_running[lane] < self.lane_limits[lane]
+
+    def _interactive_waiting(self) -> bool:
+        """Interactive jobs are queued and only the global cap keeps them from starting"""
+        return bool(self._turns["interactive"]) and \
+            self._lane_running["interactive"] < self.lane_limits["interactive"]
+
+    def _take_slot(self, ticket: JobTicket):
+        self._running += 1
+        self._lane_running[ticket.lane] += 1
+        ticket.holding_slot = True
+
+    def _release_slot(self, ticket: JobTicket):
+        self._running -= 1
+        self._lane_running[ticket.lane] -= 1
+        ticket.holding_slot = False
+
+    def _dispatch(self):
+        if not self.accepting:
+            return
+        # Bulk jobs up to their reserved share, then interactive jobs, then the remaining bulk jobs
+        while self._bulk_waiting() and self._lane_running["bulk"] < self.min_bulk_jobs and self._can_start("bulk"):
+            self._start_bulk()
+        while self._turns["interactive"] and self._can_start("interactive"):
+            self._start_next("interactive")
+        while self._bulk_waiting() and self._can_start("bulk"):
+            self._start_bulk()
+
+    def _bulk_waiting(self) -> bool:
+        return bool(self._paused or self._turns["bulk"])
+
+    def _start_bulk(self):
+        """Resume a bulk job that yielded, or else start a new one"""
+        if self._paused:
+            ticket = self._paused.popleft()
+            self._take_slot(ticket)
+            ticket.resume.set_result(None)
+        else:
+            self._start_next("bulk")
+
+    def _start_next(self, lane: str):
+        user = self._turns[lane].popleft()
+        queue = self._queues[lane][user]
+        session_id, job_factory = queue.popleft()
+        if queue:
+            self._turns[lane].append(user)
+        else:
+            del self._queues[lane][user]
+        ticket = JobTicket(user, session_id, lane)
+        self._take_slot(ticket)
+        task = asyncio.create_task(self._run(ticket, job_factory))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def yield_point(self):
+        """Called by jobs between steps. A bulk job gives its slot to waiting
+        interactive jobs and resumes once it gets a slot back; for any other
+        job, with nothing waiting, or when only the reserved bulk share is
+        running, this returns immediately."""
+        ticket = current_job.get()
+        if ticket is None or ticket.lane != "bulk" or not self.bulk_yields:
+            return
+        async with ticket.lock:
+            if not ticket.holding_slot or not self._interactive_waiting() or \
+                    self._lane_running["bulk"] <= self.min_bulk_jobs:
+                return
+            self._release_slot(ticket)
+            ticket.resume = asyncio.get_running_loop().create_future()
+            self._paused.append(ticket)
+            self.yields += 1
+            self._dispatch()
+            await ticket.resume
+
+    async def _run(self, ticket: JobTicket, job_factory: Callable[[], Awaitable]):
+        current_job.set(ticket)  # tasks run in a copy of the context, so this stays with the job
+        user, session_id = ticket.user, ticket.session_id
+        try:
+            await job_factory()
+        except Exception as e:
+            print(f"Error running job for session {session_id}: {e}")
+        finally:
+            if ticket in self._paused:
+                self._paused.remove(ticket)
+            if ticket.holding_slot:
+                self._release_slot(ticket)
+            self._release_user(user, session_id)
+            self._dispatch()
+
+    def _release_user(self, user: str, session_id: str):
+        """Take a finished or dropped job off its user's limits"""
+        self._user_jobs[user] -= 1
+        if not self._user_jobs[user]:
+            del self._user_jobs[user]
+        user_sessions = self._user_sessions[user]
+        user_sessions[session_id] -= 1
+        if not user_sessions[session_id]:
+            del user_sessions[session_id]
+        if not user_sessions:
+            del self._user_sessions[user]
+
+    def start(self):
+        self.accepting = True
+
+    async def shutdown(self, timeout: float) -> Dict[str, int]:
+        """Stop accepting and starting jobs, give running ones `timeout` seconds
+        to finish, then cancel the rest. Queued jobs are dropped - callers that
+        need them back must have checkpointed them."""
+        self.accepting = False
+        queued = 0
+        for lane in JOB_LANES:
+            for user, queue in self._queues[lane].items():
+                for session_id, _ in queue:
+                    self._release_user(user, session_id)
+                queued += len(queue)
+            self._queues[lane].clear()
+            self._turns[lane].clear()
+        drained, pending = set(), set()
+        if self._tasks:
+            drained, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        return {"drained": len(drained), "cancelled": len(pending), "dropped": queued}
+
+    def stats(self) -> Dict[str, Any]:
+        lanes = {
+            lane: {
+                "running": self._lane_running[lane],
+                "queued": sum(len(queue) for queue in self._queues[lane].values()),
+                "max_jobs": self.lane_limits[lane]
+            }
+            for lane in JOB_LANES
+        }
+        return {
+            "accepting": self.accepting,
+            "running": self._running,
+            "queued": sum(lane["queued"] for lane in lanes.values()),
+            "users_waiting": sum(len(turns) for turns in self._turns.values()),
+            "max_concurrent_jobs": self.max_concurrent_jobs,
+            "lanes": lanes,
+            "paused_bulk_jobs": len(self._paused),
+            "bulk_yields": self.yields
+        }
+
+# Global rate limiter and scheduler for query jobs
+rate_limiter = TokenBucketRateLimiter(rate=RATE_LIMIT_PER_MINUTE / 60, burst=RATE_LIMIT_BURST)
+job_scheduler = FairJobScheduler()
+
+def too_many_requests(reason: str, message: str, retry_after: Optional[float] = None) -> HTTPException:
+    """Structured 429 response for rate and scheduling limits"""
+    detail = {"error": reason, "message": message}
+    headers = None
+    if retry_after is not None:
+        detail["retry_after"] = round(retry_after, 2)
+        headers = {"Retry-After": str(math.ceil(retry_after))}
+    return HTTPException(status_code=429, detail=detail, headers=headers)
+
+# Global blob store for interned message payloads
+blob_store = BlobStore()
+
+# Job checkpointing and shutdown settings, overridable via environment
+JOB_CHECKPOINT_DIR = os.getenv("JOB_CHECKPOINT_DIR", "checkpoints")
+JOB_RESUME_MAX_AGE = float(os.getenv("JOB_RESUME_MAX_AGE", "3600"))  # older interrupted jobs are failed instead
+SHUTDOWN_GRACE_PERIOD = float(os.getenv("SHUTDOWN_GRACE_PERIOD", "10"))
+
+class JobCheckpointStore:
+    """One JSON file per outstanding query job, rewritten at each step boundary.
+
+    A job record holds its inputs (query, response type, owner and enough of
+    the session to recreate it), the last step reached and the results of
+    finished steps. Files are replaced atomically, so a crash mid-write
+    leaves the previous checkpoint intact.
+    """
+
+    def __init__(self, checkpoints_dir: str = JOB_CHECKPOINT_DIR):
+        self.checkpoints_dir = checkpoints_dir
+        os.makedirs(self.checkpoints_dir, exist_ok=True)
+
+    def get_checkpoint_path(self, job_id: str) -> str:
+        return os.path.join(self.checkpoints_dir, f"{job_id}.json")
+
+    def save(self, job: Dict[str, Any]):
+        path = self.get_checkpoint_path(job["job_id"])
+        try:
+            with open(path + ".tmp", 'w') as f:
+                json.dump(job, f)
+            os.replace(path + ".tmp", path)
+        except Exception as e:
+            print(f"Error writing job checkpoint: {e}")
+
+    def remove(self, job_id: str):
+        path = self.get_checkpoint_path(job_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def load_all(self) -> List[Dict[str, Any]]:
+        """Outstanding jobs, oldest first"""
+        jobs = []
+        for name in os.listdir(self.checkpoints_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.checkpoints_dir, name), 'r') as f:
+                    jobs.append(json.load(f))
+            except Exception as e:
+                print(f"Error reading job checkpoint {name}: {e}")
+        return sorted(jobs, key=lambda job: job["created_at"])
+
+# Global checkpoint store for query jobs
+job_checkpoints = JobCheckpointStore()
+
+class SessionStore:
+    """Thread-safe session storage with copy-on-write records.
+
+    Sync endpoints read sessions from FastAPI's threadpool while background
+    jobs update them on the event loop. Writers are serialized per session,
+    and every write publishes a fresh read-only record (messages is a tuple),
+    so readers never lock and always see a consistent snapshot that later
+    writes can't change underneath them.
+
+    Sessions are also indexed by owner (user_email), least to most recently
+    active, so per-user listing costs O(that user's sessions).
+    """
+
+    def __init__(self):
+        self._records: Dict[str, MappingProxyType] = {}
+        self._session_locks: Dict[str, threading.Lock] = {}
+        self._owners: Dict[str, "OrderedDict[str, None]"] = {}
+        # Guards membership of the dicts above; never held while waiting on a session lock
+        self._lock = threading.Lock()
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._records
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __getitem__(self, session_id: str) -> MappingProxyType:
+        return self._records[session_id]
+
+    def get(self, session_id: str) -> Optional[MappingProxyType]:
+        """Snapshot of a session, or None"""
+        return self._records.get(session_id)
+
+    def snapshot_all(self) -> List[MappingProxyType]:
+        with self._lock:
+            return list(self._records.values())
+
+    def sessions_for_user(self, user: str) -> List[MappingProxyType]:
+        """Snapshots of a user's sessions, most recently active first"""
+        with self._lock:
+            owned = self._owners.get(user, ())
+            return [self._records[session_id] for session_id in reversed(owned)]
+
+    def create(self, session_id: str, **fields) -> bool:
+        """Create a session unless it already exists. Returns whether it was created."""
+        record = MappingProxyType({"session_id": session_id, **fields, "messages": ()})
+        with self._lock:
+            if session_id in self._records:
+                return False
+            self._records[session_id] = record
+            self._session_locks[session_id] = threading.Lock()
+            self._index(record)
+        return True
+
+    def update(self, session_id: str, **changes) -> Optional[MappingProxyType]:
+        """Replace fields of a session. Returns the new snapshot, or None if it is gone."""
+        return self._write(session_id, lambda record: changes)
+
+    def append_message(self, session_id: str, message: Dict[str, Any], **changes) -> Optional[MappingProxyType]:
+        """Append a message and apply field changes in one atomic write"""
+        return self._write(session_id, lambda record: {**changes, "messages": record["messages"] + (message,)})
+
+    def delete(self, session_id: str) -> Optional[MappingProxyType]:
+        """Remove a session, returning its last snapshot (None if it didn't exist)"""
+        with self._lock:
+            record = self._records.pop(session_id, None)
+            self._session_locks.pop(session_id, None)
+            if record is not None:
+                owned = self._owners.get(record.get("user_email"))
+                if owned is not None:
+                    owned.pop(session_id, None)
+                    if not owned:
+                        del self._owners[record["user_email"]]
+        return record
+
+    def _write(self, session_id: str, build_changes) -> Optional[MappingProxyType]:
+        session_lock = self._session_locks.get(session_id)
+        if session_lock is None:
+            return None
+        with session_lock:
+            current = self._records.get(session_id)
+            if current is None:
+                return None
+            record = MappingProxyType({**current, **build_changes(current)})
+            with self._lock:
+                # Deleted while we were building - don't resurrect it
+                if self._records.get(session_id) is not current:
+                    return None
+                self._records[session_id] = record
+                if record.get("last_activity") != current.get("last_activity"):
+                    self._index(record)
+        return record
+
+    def _index(self, record: MappingProxyType):
+        owner = record.get("user_email")
+        if owner:
+            owned = self._owners.setdefault(owner, OrderedDict())
+            owned[record["session_id"]] = None
+            owned.move_to_end(record["session_id"])
+
 # In-memory storage
-sessions = {}
+sessions = SessionStore()
 uploaded_files = {}
 
-async def simulate_analysis_with_progress(session_id: str, user_query: str, response_type: str):
-    """Simulate analysis process with realistic progress steps - exactly 15 seconds with 6 steps"""
-    
-    # Fixed progress steps - same for all request types to match user requirements
-    steps = [
-        ("Scanning databases", "Connecting to data sources and scanning available datasets..."),
-        ("Analyzing", "Processing and analyzing data patterns..."),
-        ("Fetching relevant data", "Retrieving specific data points for your request..."),
-        ("Writing code", "Generating code and logic for your analysis..."),
-        ("Executing code", "Running analysis and processing results..."),
-        ("Preparing response", "Finalizing response with insights and recommendations...")
-    ]
-    
-    total_steps = len(steps)
-    
-    for i, (step_name, step_message) in enumerate(steps, 1):
-        await progress_logger.log_progress(
-            session_id=session_id,
-            step=step_name,
-            message=step_message,
-            step_number=i,
-            total_steps=total_steps
+def normalize_user(user_email: str) -> str:
+    return user_email.strip().lower()
+
+# Message fields that can be served lazily as references instead of inline
+ATTACHMENT_FIELDS = ("chart_data", "file_info")
+# Assistant message fields stored once in the blob store and referenced by hash
+INTERNED_FIELDS = ("content", "chart_data")
+MAX_MESSAGE_PAGE_SIZE = 200
+
+def append_message(session_id: str, message: Dict[str, Any], **changes) -> Dict[str, Any]:
+    """Append a message to a session, giving it a stable message_id.
+
+    Large assistant payloads are interned in the blob store; the stored
+    message keeps their keys under "blob_refs". `changes` (e.g. status)
+    are applied to the session in the same atomic write.
+    """
+    message = {"message_id": str(uuid.uuid4()), **message}
+    if message.get("type") == "assistant":
+        refs = {field: blob_store.put(message.pop(field)) for field in INTERNED_FIELDS if field in message}
+        if refs:
+            message["blob_refs"] = refs
+    if sessions.append_message(session_id, message, **changes) is None:
+        # Session was deleted meanwhile
+        release_message(message)
+    return message
+
+def resolve_message(message: Dict[str, Any], fields=None) -> Dict[str, Any]:
+    """Message with interned fields loaded back from the blob store (only `fields`, if given)"""
+    refs = message.get("blob_refs")
+    if not refs:
+        return message
+    resolved = {key: value for key, value in message.items() if key != "blob_refs"}
+    for field, key in refs.items():
+        if fields is None or field in fields:
+            resolved[field] = blob_store.get(key)
+    return resolved
+
+def release_message(message: Dict[str, Any]):
+    for key in message.get("blob_refs", {}).values():
+        blob_store.release(key)
+
+def message_view(session_id: str, message: Dict[str, Any], attachments: str = "inline") -> Dict[str, Any]:
+    """Message as returned to clients - with attachments="ref", large payloads become URLs"""
+    if attachments == "inline":
+        return resolve_message(message)
+    stored_fields = set(message) | set(message.get("blob_refs", {}))
+    inline_fields = [field for field in INTERNED_FIELDS if field not in ATTACHMENT_FIELDS]
+    view = {key: value for key, value in resolve_message(message, inline_fields).items()
+            if key not in ATTACHMENT_FIELDS}
+    refs = {
+        name: f"/api/sessions/{session_id}/messages/{message['message_id']}/attachments/{name}"
+        for name in ATTACHMENT_FIELDS if name in stored_fields
+    }
+    if refs:
+        view["attachments"] = refs
+    return view
+
+class PipelineContext:
+    """Per-run state shared by the steps of an analysis pipeline"""
+
+    def __init__(self, session_id: str, user_query: str, response_type: str,
+                 logger: ProgressLogger, clock: Clock, delays: StepDelayProfile):
+        self.session_id = session_id
+        self.user_query = user_query
+        self.response_type = response_type
+        self.logger = logger
+        self.clock = clock
+        self.delays = delays
+        # Pre-filled results mark steps already done by an earlier, interrupted run
+        self.results: Dict[str, Any] = {}
+        self.on_step_done: Optional[Callable[[str, Any], None]] = None
+        # Awaited before each step starts, e.g. to let a scheduler pause the run
+        self.yield_point: Optional[Callable[[], Awaitable]] = None
+
+class PipelineStep:
+    """A named pipeline stage with an async handler and the steps it depends on"""
+
+    def __init__(self, name: str, message: str, handler=None, depends_on: Optional[List[str]] = None):
+        self.name = name
+        self.message = message
+        self.handler = handler or self.simulate
+        self.depends_on = list(depends_on or [])
+
+    def simulate(self, ctx: PipelineContext) -> Awaitable:
+        """Default handler - just takes the profiled amount of time.
+        Hands back the sleep itself so each step doesn't cost another coroutine frame."""
+        return ctx.clock.sleep(ctx.delays.delay_for(self.name))
+
+class AnalysisPipeline:
+    """Dependency-ordered analysis steps; steps whose dependencies are met run concurrently.
+
+    Dependencies must be registered before the steps that use them, which
+    keeps the graph acyclic and makes registration order the tie-breaker
+    for step numbering.
+    """
+
+    def __init__(self):
+        self.steps: Dict[str, PipelineStep] = {}
+
+    def add_step(self, name: str, message: str, handler=None,
+                 depends_on: Optional[List[str]] = None) -> PipelineStep:
+        if name in self.steps:
+            raise ValueError(f"Step '{name}' is already registered")
+        missing = [dep for dep in (depends_on or []) if dep not in self.steps]
+        if missing:
+            raise ValueError(f"Step '{name}' depends on unregistered steps: {missing}")
+        step = PipelineStep(name, message, handler, depends_on)
+        self.steps[name] = step
+        return step
+
+    def step(self, name: str, message: str, depends_on: Optional[List[str]] = None):
+        """Decorator form of add_step for handler functions taking a PipelineContext"""
+        def decorator(handler):
+            self.add_step(name, message, handler, depends_on)
+            return handler
+        return decorator
+
+    def critical_path(self, delays: StepDelayProfile) -> float:
+        """Expected end-to-end latency when every step takes its base profiled delay"""
+        finish: Dict[str, float] = {}
+        for step in self.steps.values():
+            start = max((finish[dep] for dep in step.depends_on), default=0.0)
+            finish[step.name] = start + delays.overrides.get(step.name, delays.default)
+        return max(finish.values(), default=0.0)
+
+    async def _run_step(self, ctx: PipelineContext, step: PipelineStep, step_number: int):
+        if ctx.yield_point:
+            await ctx.yield_point()
+        await ctx.logger.log_progress(
+            session_id=ctx.session_id,
+            step=step.name,
+            message=step.message,
+            step_number=step_number,
+            total_steps=len(self.steps)
         )
-        
-        # New timing: 3 seconds total / 6 steps = 0.5 seconds per step
-        await asyncio.sleep(0.5)
+        started_at = ctx.clock.time()
+        result = await step.handler(ctx)
+        ctx.logger.index.record_step_duration(step.name, ctx.clock.time() - started_at)
+        return result
+
+    async def run(self, ctx: PipelineContext) -> Dict[str, Any]:
+        """Run all steps, logging each one as it starts. Step numbers follow start order.
+
+        Steps already in ctx.results are skipped, so a checkpointed run can pick
+        up where it left off. ctx.on_step_done is called as each step finishes.
+        """
+        total_steps = len(self.steps)
+        done = {name for name in ctx.results if name in self.steps}
+        started = len(done)
+        running: Dict[asyncio.Task, str] = {}
+
+        while len(done) < total_steps:
+            ready = [step for step in self.steps.values()
+                     if step.name not in done and step.name not in running.values()
+                     and all(dep in done for dep in step.depends_on)]
+            if len(ready) == 1 and not running:
+                # A lone ready step is awaited inline - a task per step is only
+                # worth its scheduling overhead when steps actually overlap
+                started += 1
+                finished = [(ready[0].name, await self._run_step(ctx, ready[0], started))]
+            else:
+                for step in ready:
+                    started += 1
+                    running[asyncio.create_task(self._run_step(ctx, step, started))] = step.name
+                tasks, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                finished = []
+                for task in tasks:
+                    name = running.pop(task)
+                    if task.exception() is not None:
+                        for other in running:
+                            other.cancel()
+                        await asyncio.gather(*running, return_exceptions=True)
+                        raise task.exception()
+                    finished.append((name, task.result()))
+
+            for name, result in finished:
+                ctx.results[name] = result
+                done.add(name)
+                if ctx.on_step_done:
+                    ctx.on_step_done(name, result)
+
+        return ctx.results
+
+# Default analysis flow - fetching data and writing code both only need the
+# analysis step, so they run side by side.
+analysis_pipeline = AnalysisPipeline()
+analysis_pipeline.add_step("Scanning databases", "Connecting to data sources and scanning available datasets...")
+analysis_pipeline.add_step("Analyzing", "Processing and analyzing data patterns...",
+                           depends_on=["Scanning databases"])
+analysis_pipeline.add_step("Fetching relevant data", "Retrieving specific data points for your request...",
+                           depends_on=["Analyzing"])
+analysis_pipeline.add_step("Writing code", "Generating code and logic for your analysis...",
+                           depends_on=["Analyzing"])
+analysis_pipeline.add_step("Executing code", "Running analysis and processing results...",
+                           depends_on=["Fetching relevant data", "Writing code"])
+analysis_pipeline.add_step("Preparing response", "Finalizing response with insights and recommendations...",
+                           depends_on=["Executing code"])
+
+async def simulate_analysis_with_progress(session_id: str, user_query: str, response_type: str,
+                                          logger: Optional[ProgressLogger] = None,
+                                          clock: Optional[Clock] = None,
+                                          delays: Optional[StepDelayProfile] = None,
+                                          pipeline: Optional[AnalysisPipeline] = None,
+                                          completed: Optional[Dict[str, Any]] = None,
+                                          on_step_done: Optional[Callable[[str, Any], None]] = None,
+                                          yield_point: Optional[Callable[[], Awaitable]] = None) -> Dict[str, Any]:
+    """Simulate analysis process with realistic progress steps - 6 steps, 2.5 second critical path by default.
+
+    `completed` holds results of steps finished before an interruption; those steps are not rerun.
+    """
+    logger = logger or progress_logger
+    pipeline = pipeline or analysis_pipeline
+    ctx = PipelineContext(session_id, user_query, response_type,
+                          logger=logger,
+                          clock=clock or logger.clock,
+                          delays=delays or default_step_delays)
+    ctx.results.update(completed or {})
+    ctx.on_step_done = on_step_done
+    ctx.yield_point = yield_point
+    
+    results = await pipeline.run(ctx)
+    total_steps = len(pipeline.steps)
     
     # Final completion log
-    await progress_logger.log_progress(
+    await logger.log_progress(
         session_id=session_id,
         step="Completed",
         message="Analysis completed successfully!",
         step_number=total_steps,
         total_steps=total_steps
     )
+    return results
+
+async def run_capacity_simulation(num_sessions: int, clock: Clock,
+                                  delays: Optional[StepDelayProfile] = None,
+                                  arrival_interval: float = 0.0) -> Dict[str, Any]:
+    """Run many simulated sessions through the analysis pipeline and report scheduling stats.
+
+    Intended to be driven by VirtualClock.run() so that large session counts
+    finish in seconds of wall time. Logs are kept in memory only.
+    """
+    logger = ProgressLogger(logs_dir=None, clock=clock)
+    latencies: List[float] = []
+    in_flight = 0
+    peak_in_flight = 0
+    wall_start = time.perf_counter()
+    virtual_start = clock.time()
+
+    async def run_session(index: int):
+        nonlocal in_flight, peak_in_flight
+        in_flight += 1
+        peak_in_flight = max(peak_in_flight, in_flight)
+        started = clock.time()
+        await simulate_analysis_with_progress(f"sim-{index}", "simulated query", "chart",
+                                              logger=logger, clock=clock, delays=delays)
+        latencies.append(clock.time() - started)
+        in_flight -= 1
+
+    tasks = []
+    for i in range(num_sessions):
+        tasks.append(asyncio.create_task(run_session(i)))
+        if arrival_interval:
+            await clock.sleep(arrival_interval)
+    await asyncio.gather(*tasks)
+
+    latencies.sort()
+    def percentile(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+
+    return {
+        "sessions": num_sessions,
+        "entries_logged": sum(len(logs) for logs in logger.session_progress.values()),
+        "virtual_seconds": round(clock.time() - virtual_start, 6),
+        "wall_seconds": round(time.perf_counter() - wall_start, 6),
+        "peak_concurrent_sessions": peak_in_flight,
+        "latency_p50": percentile(0.50),
+        "latency_p95": percentile(0.95),
+        "latency_max": latencies[-1] if latencies else 0.0
+    }
+
+# Uploaded data analysis settings, overridable via environment
+UPLOADS_DIR = os.getenv("UPLOADS_DIR", "uploads")
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "100000"))
+MAX_CHART_CATEGORIES = 10
+MAX_GROUP_KEYS = int(os.getenv("MAX_GROUP_KEYS", "10000"))  # distinct values tracked per text column
+OTHER_GROUP_LABEL = "(other)"
+MAX_SCATTER_POINTS = 500
+CHART_COLORS = ["#3B82F6", "#10B981", "#F59E0B", "#EF4444", "#8B5CF6"]
+TIME_BUCKET_FORMATS = {"D": "%Y-%m-%d", "W": "Week of %Y-%m-%d", "M": "%b %Y", "Y": "%Y"}
+
+def infer_column_kind(values) -> str:
+    """"number", "datetime" or "text", judged from a sample of raw CSV values"""
+    present = [value.strip() for value in values if value.strip()]
+    if not present:
+        return "text"
+    for kind, dtype in (("number", np.float64), ("datetime", "datetime64[s]")):
+        try:
+            np.array(present, dtype=dtype)
+            return kind
+        except ValueError:
+            pass
+    return "text"
+
+def _parse_or_missing(value: str, dtype, missing):
+    try:
+        return np.array(value, dtype=dtype)
+    except ValueError:
+        return missing
+
+def convert_column(values, kind: str) -> np.ndarray:
+    """Raw CSV values to a typed array; values that don't fit the kind become NaN/NaT"""
+    if kind == "text":
+        return np.array([value.strip() or "(blank)" for value in values], dtype=str)
+    dtype, missing = (np.float64, "nan") if kind == "number" else ("datetime64[s]", "NaT")
+    cleaned = [value.strip() or missing for value in values]
+    try:
+        return np.array(cleaned, dtype=dtype)
+    except ValueError:
+        # Rare bad values - fall back to parsing one at a time
+        return np.array([_parse_or_missing(value, dtype, missing) for value in cleaned], dtype=dtype)
+
+class CsvDataset:
+    """An uploaded CSV read as a stream of columnar NumPy chunks.
+
+    Column kinds are inferred from the first chunk of rows. Only one chunk
+    (chunk_rows rows) is held in memory at a time, so analyses that fold
+    chunks into running aggregates work in bounded memory on files of any
+    length.
+    """
+
+    def __init__(self, path: str, chunk_rows: int = CSV_CHUNK_ROWS):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        with self._open() as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if not header:
+                raise ValueError("The CSV file is empty")
+            self.columns = self._column_names(header)
+            sample = self._split(list(itertools.islice(reader, chunk_rows)))
+        self.kinds = {name: infer_column_kind(values) for name, values in zip(self.columns, sample)}
+        self._sample_distinct = {name: len(set(value.strip() for value in values))
+                                 for name, values in zip(self.columns, sample) if self.kinds[name] == "text"}
+
+    def _open(self):
+        return open(self.path, 'r', newline='', encoding='utf-8-sig', errors='replace')
+
+    @staticmethod
+    def _column_names(header: List[str]) -> List[str]:
+        names = []
+        for i, name in enumerate(header):
+            name = name.strip() or f"column_{i + 1}"
+            while name in names:
+                name += "_"
+            names.append(name)
+        return names
+
+    def _split(self, rows: List[List[str]]) -> List[Tuple[str, ...]]:
+        """Rows to per-column value tuples, padding or trimming ragged rows"""
+        width = len(self.columns)
+        if not rows:
+            return [()] * width
+        rows = [row[:width] if len(row) >= width else row + [""] * (width - len(row)) for row in rows]
+        return list(zip(*rows))
+
+    def iter_chunks(self, columns: Optional[List[str]] = None):
+        """Yield {column: array} dicts of up to chunk_rows rows each, converting only `columns` if given"""
+        wanted = set(columns or self.columns)
+        with self._open() as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            while True:
+                rows = list(itertools.islice(reader, self.chunk_rows))
+                if not rows:
+                    return
+                yield {name: convert_column(values, self.kinds[name])
+                       for name, values in zip(self.columns, self._split(rows)) if name in wanted}
+
+    def label(self, column: str, key: Any) -> Any:
+        """Display value for a group key from column (keys are already values here)"""
+        return key
+
+    def cardinality(self, column: str) -> int:
+        """Distinct values of a text column, counted in the first chunk - a lower bound"""
+        return self._sample_distinct[column]
+
+COLUMN_CACHE_DIR = os.getenv("COLUMN_CACHE_DIR", "column_cache")
+COLUMN_CACHE_MAX_BYTES = int(os.getenv("COLUMN_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+COLUMN_CACHE_STALE_BUILD = float(os.getenv("COLUMN_CACHE_STALE_BUILD", "3600"))  # seconds without writes
+
+class ColumnarDataset:
+    """A parsed upload opened from the column cache - same interface as CsvDataset.
+
+    Columns are read-only memory maps, so chunks are zero-copy views and
+    every process opening the same entry shares the OS page cache. Text
+    columns are dictionary encoded: chunks hold int32 codes and label()
+    turns a code back into its text.
+    """
+
+    def __init__(self, entry_dir: str, meta: Dict[str, Any], chunk_rows: int = CSV_CHUNK_ROWS):
+        self.columns: List[str] = meta["columns"]
+        self.kinds: Dict[str, str] = meta["kinds"]
+        self.rows: int = meta["rows"]
+        self.chunk_rows = chunk_rows
+        self._arrays: Dict[str, np.ndarray] = {}
+        self._categories: Dict[str, np.ndarray] = {}
+        for i, name in enumerate(self.columns):
+            dtype = np.dtype(meta["dtypes"][name])
+            if self.rows:
+                self._arrays[name] = np.memmap(os.path.join(entry_dir, f"col{i}.bin"), dtype=dtype,
+                                               mode='r', shape=(self.rows,))
+            else:
+                self._arrays[name] = np.empty(0, dtype=dtype)  # mmap can't map an empty file
+            if self.kinds[name] == "text":
+                with open(os.path.join(entry_dir, f"col{i}.categories.json"), 'r') as f:
+                    self._categories[name] = np.array(json.load(f), dtype=object)
+
+    def iter_chunks(self, columns: Optional[List[str]] = None):
+        columns = columns or self.columns
+        for start in range(0, self.rows, self.chunk_rows):
+            yield {name: self._arrays[name][start:start + self.chunk_rows] for name in columns}
+
+    def label(self, column: str, key: Any) -> Any:
+        if self.kinds[column] == "text":
+            return self._categories[column][key]
+        return key
+
+    def cardinality(self, column: str) -> int:
+        return len(self._categories[column])
+
+class ColumnarCache:
+    """On-disk cache of parsed uploads as typed column files, keyed by content hash.
+
+    Each entry is a directory holding one raw binary file per column plus a
+    meta.json with names, kinds, dtypes and the row count. Entries are built
+    in a temporary directory and renamed into place, so readers never see a
+    partial entry. Text columns keep at most MAX_GROUP_KEYS distinct values;
+    the rest are stored as OTHER_GROUP_LABEL. Total size is capped at
+    max_bytes by evicting the least recently opened entries; opening an
+    entry touches its meta.json, so the order is shared by every process
+    using the directory and survives restarts. Safe to use from worker
+    threads and from several processes at once: the directory is re-scanned
+    before evicting, and a miss checks the disk for an entry another
+    process built.
+    """
+
+    def __init__(self, cache_dir: str = COLUMN_CACHE_DIR, max_bytes: int = COLUMN_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # content hash -> bytes, least recent first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_entries()
+
+    def _load_entries(self):
+        """(Re)build the entry list from disk, least recently opened first"""
+        found = []
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            meta_path = os.path.join(entry_dir, "meta.json")
+            try:
+                if name.startswith(".build-"):
+                    # Another process may still be writing it - only clear out crashed builds
+                    if time.time() - self._last_write(entry_dir) > COLUMN_CACHE_STALE_BUILD:
+                        shutil.rmtree(entry_dir, ignore_errors=True)
+                    continue
+                if not os.path.exists(meta_path):
+                    # Left half-deleted by an eviction that was interrupted
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                    continue
+                found.append((os.path.getmtime(meta_path), name, self._dir_bytes(entry_dir)))
+            except OSError:
+                continue  # removed by another process while scanning
+        self._entries.clear()
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+
+    @staticmethod
+    def _last_write(entry_dir: str) -> float:
+        return max([os.path.getmtime(entry_dir)] + [entry.stat().st_mtime for entry in os.scandir(entry_dir)])
+
+    @staticmethod
+    def _dir_bytes(entry_dir: str) -> int:
+        return sum(entry.stat().st_size for entry in os.scandir(entry_dir))
+
+    def get_entry_dir(self, content_hash: str) -> str:
+        return os.path.join(self.cache_dir, content_hash)
+
+    def open(self, content_hash: str) -> Optional[ColumnarDataset]:
+        """The cached columns for an upload, or None on a miss"""
+        with self._lock:
+            if content_hash not in self._entries and not os.path.exists(
+                    os.path.join(self.get_entry_dir(content_hash), "meta.json")):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._open_entry(content_hash)
+
+    def _open_entry(self, content_hash: str) -> Optional[ColumnarDataset]:
+        """Map an entry and mark it most recently used. Call with the lock held."""
+        entry_dir = self.get_entry_dir(content_hash)
+        meta_path = os.path.join(entry_dir, "meta.json")
+        try:
+            if content_hash in self._entries:
+                self._entries.move_to_end(content_hash)
+            else:
+                self._entries[content_hash] = self._dir_bytes(entry_dir)  # built by another process
+            os.utime(meta_path)
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            return ColumnarDataset(entry_dir, meta)
+        except Exception as e:
+            print(f"Error opening column cache entry: {e}")
+            self._remove(content_hash)
+            return None
+
+    def build(self, content_hash: str, dataset: CsvDataset) -> Optional[ColumnarDataset]:
+        """Parse a CSV once into column files and return it opened from the cache.
+        Returns None if the entry alone would exceed the cache size."""
+        build_dir = os.path.join(self.cache_dir, f".build-{uuid.uuid4().hex}")
+        os.makedirs(build_dir)
+        try:
+            self._write_columns(build_dir, dataset)
+            size = self._dir_bytes(build_dir)
+            if size > self.max_bytes:
+                return None
+            with self._lock:
+                try:
+                    os.rename(build_dir, self.get_entry_dir(content_hash))
+                except OSError:
+                    pass  # another thread or process built the same upload first - use theirs
+                else:
+                    self._entries[content_hash] = size
+                result = self._open_entry(content_hash)
+                self._evict(keep=content_hash)
+                return result
+        finally:
+            shutil.rmtree(build_dir, ignore_errors=True)
+
+    @staticmethod
+    def _write_columns(build_dir: str, dataset: CsvDataset):
+        files = [open(os.path.join(build_dir, f"col{i}.bin"), 'wb') for i in range(len(dataset.columns))]
+        codes: Dict[str, Dict[str, int]] = {name: {} for name in dataset.columns if dataset.kinds[name] == "text"}
+        dtypes = {}
+        rows = 0
+        try:
+            for chunk in dataset.iter_chunks():
+                for i, name in enumerate(dataset.columns):
+                    values = chunk[name]
+                    if name in codes:
+                        # Dictionary encode: map this chunk's distinct values to stable codes
+                        uniques, inverse = np.unique(values, return_inverse=True)
+                        mapping = codes[name]
+                        chunk_codes = np.array([ColumnarCache._encode(mapping, u) for u in uniques.tolist()],
+                                               dtype=np.int32)
+                        values = chunk_codes[inverse]
+                    dtypes[name] = values.dtype.str
+                    files[i].write(np.ascontiguousarray(values).tobytes())
+                rows += len(chunk[dataset.columns[0]])
+        finally:
+            for f in files:
+                f.close()
+        for i, name in enumerate(dataset.columns):
+            if name in codes:
+                dtypes[name] = np.dtype(np.int32).str
+                with open(os.path.join(build_dir, f"col{i}.categories.json"), 'w') as f:
+                    json.dump(list(codes[name]), f)
+            else:
+                dtypes.setdefault(name, np.dtype(np.float64 if dataset.kinds[name] == "number"
+                                                 else "datetime64[s]").str)
+        meta = {"columns": dataset.columns, "kinds": dataset.kinds, "dtypes": dtypes, "rows": rows}
+        # meta.json is written last - its presence marks a complete entry
+        with open(os.path.join(build_dir, "meta.json"), 'w') as f:
+            json.dump(meta, f)
+
+    @staticmethod
+    def _encode(mapping: Dict[str, int], value: str) -> int:
+        """Code for a text value, adding it to mapping while there is room"""
+        code = mapping.get(value)
+        if code is None:
+            if len(mapping) < MAX_GROUP_KEYS:
+                code = mapping[value] = len(mapping)
+            else:
+                code = mapping.setdefault(OTHER_GROUP_LABEL, len(mapping))
+        return code
+
+    def _evict(self, keep: str):
+        """Drop least recently opened entries until the cache fits max_bytes. Call with the lock held."""
+        self._load_entries()  # pick up entries other processes added, opened or removed
+        total = sum(self._entries.values())
+        for content_hash in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if content_hash == keep:
+                continue
+            total -= self._entries[content_hash]
+            self._remove(content_hash)
+            self.evictions += 1
+
+    def _remove(self, content_hash: str):
+        # Readers that already mapped the files keep working - unlinking doesn't unmap them
+        self._entries.pop(content_hash, None)
+        shutil.rmtree(self.get_entry_dir(content_hash), ignore_errors=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+# Global cache of parsed uploads
+column_cache = ColumnarCache()
+
+class GroupAggregate:
+    """Per-group count, sum, min and max, folded in one chunk at a time.
+
+    With max_groups set, keys first seen after that many groups exist are
+    folded into a single OTHER_GROUP_LABEL group, so memory stays bounded on
+    columns with a distinct value per row.
+    """
+
+    def __init__(self, max_groups: Optional[int] = None):
+        self.groups: Dict[Any, List[float]] = {}  # key -> [count, sum, min, max]
+        self.max_groups = max_groups
+        self.overflow: Optional[List[float]] = None
+
+    def add(self, keys: np.ndarray, values: Optional[np.ndarray] = None):
+        if values is None:
+            values = np.ones(len(keys))
+        mask = ~np.isnan(values)
+        if keys.dtype.kind == "M":
+            mask &= ~np.isnat(keys)
+        keys, values = keys[mask], values[mask]
+        if not len(keys):
+            return
+        uniques, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(uniques))
+        sums = np.bincount(inverse, weights=values, minlength=len(uniques))
+        # Sort values by group so each group is a contiguous run for reduceat
+        order = np.argsort(inverse, kind="stable")
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        mins = np.minimum.reduceat(values[order], starts)
+        maxs = np.maximum.reduceat(values[order], starts)
+        for key, count, total, low, high in zip(uniques.tolist(), counts.tolist(), sums.tolist(),
+                                                mins.tolist(), maxs.tolist()):
+            group = self.groups.get(key)
+            if group is None:
+                if self.max_groups is None or len(self.groups) < self.max_groups:
+                    self.groups[key] = [count, total, low, high]
+                elif self.overflow is None:
+                    self.overflow = [count, total, low, high]
+                else:
+                    self._merge(self.overflow, [count, total, low, high])
+            else:
+                self._merge(group, [count, total, low, high])
+
+    @staticmethod
+    def _merge(group: List[float], other: List[float]):
+        group[0] += other[0]
+        group[1] += other[1]
+        group[2] = min(group[2], other[2])
+        group[3] = max(group[3], other[3])
+
+    def result(self, agg: str, label: Optional[Callable[[Any], Any]] = None) -> Dict[Any, float]:
+        """agg of each group, keyed by label(key) when a label function is given"""
+        merged: Dict[Any, List[float]] = {}
+        items = list(self.groups.items())
+        if self.overflow is not None:
+            items.append((None, self.overflow))
+        for key, group in items:
+            key = OTHER_GROUP_LABEL if key is None else label(key) if label else key
+            if key in merged:
+                self._merge(merged[key], group)
+            else:
+                merged[key] = list(group)
+        column = {"count": 0, "sum": 1, "min": 2, "max": 3}
+        if agg == "mean":
+            return {key: group[1] / group[0] for key, group in merged.items()}
+        return {key: group[column[agg]] for key, group in merged.items()}
+
+class CorrelationAccumulator:
+    """Streaming Pearson correlation plus a uniform random sample of points.
+
+    Chunk moments are merged with Chan's parallel update, which stays
+    accurate for large values where the naive sum-of-products formula
+    cancels badly. The sample keeps the points with the smallest random
+    keys seen so far, so it is uniform over the whole file.
+    """
+
+    def __init__(self, max_points: int = MAX_SCATTER_POINTS, seed: int = 0):
+        self.n = 0
+        self.mean_x = self.mean_y = 0.0
+        self.m_xx = self.m_yy = self.m_xy = 0.0
+        self.max_points = max_points
+        self.rng = np.random.default_rng(seed)
+        self.sample = (np.empty(0), np.empty(0), np.empty(0))  # keys, x, y
+
+    def add(self, x: np.ndarray, y: np.ndarray):
+        mask = ~(np.isnan(x) | np.isnan(y))
+        x, y = x[mask], y[mask]
+        n_b = len(x)
+        if not n_b:
+            return
+        mean_x_b, mean_y_b = x.mean(), y.mean()
+        dx_b, dy_b = x - mean_x_b, y - mean_y_b
+        n = self.n + n_b
+        delta_x, delta_y = mean_x_b - self.mean_x, mean_y_b - self.mean_y
+        self.m_xx += dx_b @ dx_b + delta_x * delta_x * self.n * n_b / n
+        self.m_yy += dy_b @ dy_b + delta_y * delta_y * self.n * n_b / n
+        self.m_xy += dx_b @ dy_b + delta_x * delta_y * self.n * n_b / n
+        self.mean_x += delta_x * n_b / n
+        self.mean_y += delta_y * n_b / n
+        self.n = n
+
+        keys = np.concatenate((self.sample[0], self.rng.random(n_b)))
+        xs = np.concatenate((self.sample[1], x))
+        ys = np.concatenate((self.sample[2], y))
+        if len(keys) > self.max_points:
+            keep = np.argpartition(keys, self.max_points)[:self.max_points]
+            keys, xs, ys = keys[keep], xs[keep], ys[keep]
+        self.sample = (keys, xs, ys)
+
+    def correlation(self) -> Optional[float]:
+        if self.n < 2 or not self.m_xx or not self.m_yy:
+            return None
+        return self.m_xy / math.sqrt(self.m_xx * self.m_yy)
+
+def _mentioned_first(names: List[str], user_query: str) -> List[str]:
+    """Column names ordered by where the query mentions them; unmentioned ones keep their order at the end"""
+    query_lower = user_query.lower()
+    positions = {name: query_lower.find(name.lower()) for name in names}
+    return sorted(names, key=lambda name: (positions[name] < 0, positions[name]))
+
+def choose_aggregation(user_query: str) -> str:
+    query_lower = user_query.lower()
+    for agg, keywords in (("mean", ["average", "mean", "avg"]), ("count", ["count", "number of", "how many"]),
+                          ("max", ["max", "highest", "largest"]), ("min", ["min", "lowest", "smallest"])):
+        if any(keyword in query_lower for keyword in keywords):
+            return agg
+    return "sum"
+
+def choose_time_bucket(user_query: str) -> str:
+    query_lower = user_query.lower()
+    for unit, keywords in (("D", ["daily", "per day", "by day"]), ("W", ["weekly", "per week", "by week"]),
+                           ("Y", ["yearly", "annual", "per year", "by year"])):
+        if any(keyword in query_lower for keyword in keywords):
+            return unit
+    return "M"
+
+def time_bucket(values: np.ndarray, unit: str) -> np.ndarray:
+    """Truncate datetimes to unit; weeks start on Monday"""
+    if unit != "W":
+        return values.astype(f"datetime64[{unit}]")
+    # NumPy counts weeks from Thursday 1970-01-01, so shift Mondays onto Thursdays and back
+    shift = np.timedelta64(3, "D")
+    return (values + shift).astype("datetime64[W]").astype("datetime64[D]") - shift
+
+def _chart_options(title: str, legend_position: str = "top") -> Dict[str, Any]:
+    return {
+        "responsive": True,
+        "plugins": {
+            "legend": {"position": legend_position},
+            "title": {"display": True, "text": title}
+        }
+    }
+
+def analyze_dataset(dataset: CsvDataset, user_query: str, chart_type: Optional[str] = None,
+                    name: str = "the uploaded file") -> Dict[str, Any]:
+    """Single pass over a dataset producing a Chart.js spec and a short written summary.
+
+    dataset may also be a ColumnarDataset from the column cache.
+    The requested chart type is used when the data supports it (bar/pie need
+    a text column, line a date column, scatter two numeric columns);
+    otherwise the first supported type is chosen. Columns named in the
+    query are preferred over the rest.
+    """
+    by_kind = {kind: _mentioned_first([c for c in dataset.columns if dataset.kinds[c] == kind], user_query)
+               for kind in ("text", "number", "datetime")}
+    # Identifier-like columns (a distinct value per row) make poor categories - prefer any other text column
+    category = next((c for c in by_kind["text"] if dataset.cardinality(c) <= MAX_GROUP_KEYS),
+                    by_kind["text"][0] if by_kind["text"] else None)
+    time_column = by_kind["datetime"][0] if by_kind["datetime"] else None
+    numbers = by_kind["number"]
+    value = numbers[0] if numbers else None
+    agg = choose_aggregation(user_query) if value else "count"
+
+    supported = {"bar": category is not None, "pie": category is not None,
+                 "line": time_column is not None, "scatter": len(numbers) >= 2}
+    if not supported.get(chart_type):
+        chart_type = next((kind for kind in ("line", "bar", "scatter") if supported[kind]), None)
+    if chart_type is None:
+        raise ValueError(f"Couldn't find columns to chart in {name} - it needs a text, date or two numeric columns")
+
+    if chart_type == "scatter":
+        needed = numbers[:2]
+    else:
+        needed = [category if chart_type in ("bar", "pie") else time_column] + ([value] if value else [])
+
+    rows = 0
+    groups = GroupAggregate(max_groups=MAX_GROUP_KEYS if chart_type in ("bar", "pie") else None)
+    pairs = CorrelationAccumulator()
+    unit = choose_time_bucket(user_query)
+    for chunk in dataset.iter_chunks(needed):
+        rows += len(next(iter(chunk.values())))
+        values = chunk[value] if value else None
+        if chart_type in ("bar", "pie"):
+            groups.add(chunk[category], values)
+        elif chart_type == "line":
+            groups.add(time_bucket(chunk[time_column], unit), values)
+        else:
+            pairs.add(chunk[numbers[0]], chunk[numbers[1]])
+
+    measure = "Rows" if agg == "count" else f"{agg.capitalize()} of {value}"
+    if chart_type == "scatter":
+        return _scatter_result(pairs, numbers[0], numbers[1], rows, name)
+    if chart_type == "line":
+        return _line_result(groups.result(agg), unit, measure, time_column, rows, name)
+    totals = groups.result(agg, lambda key: dataset.label(category, key))
+    return _category_result(totals, chart_type, agg, measure, category, rows, name)
+
+def _category_result(totals: Dict[Any, float], chart_type: str, agg: str, measure: str,
+                     category: str, rows: int, name: str) -> Dict[str, Any]:
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+    shown = ranked[:MAX_CHART_CATEGORIES]
+    if chart_type == "pie" and len(ranked) > MAX_CHART_CATEGORIES and agg in ("sum", "count"):
+        shown = ranked[:MAX_CHART_CATEGORIES - 1] + [("Other", sum(v for _, v in ranked[MAX_CHART_CATEGORIES - 1:]))]
+    labels = [str(label) for label, _ in shown]
+    data = [round(value, 2) for _, value in shown]
+    colors = [CHART_COLORS[i % len(CHART_COLORS)] for i in range(len(shown))]
+    title = f"{measure} by {category}"
+    dataset = {"data": data, "backgroundColor": colors}
+    if chart_type == "bar":
+        dataset = {"label": measure, **dataset}
+    chart = {
+        "type": chart_type,
+        "title": title,
+        "data": {"labels": labels, "datasets": [dataset]},
+        "options": _chart_options(title, "top" if chart_type == "bar" else "right")
+    }
+    findings = [f"- {label}: {value:,.2f}" for label, value in zip(labels[:3], data[:3])]
+    content = (f"## {title}\n\n**Dataset:** {name} - {rows:,} rows, {len(totals):,} distinct {category} values\n\n"
+               f"**Top {category}:**\n" + "\n".join(findings))
+    return {"content": content, "chart_data": chart}
+
+def _line_result(totals: Dict[Any, float], unit: str, measure: str, time_column: str,
+                 rows: int, name: str) -> Dict[str, Any]:
+    buckets = sorted(totals.items())
+    labels = [np.datetime64(bucket, "D").item().strftime(TIME_BUCKET_FORMATS[unit]) for bucket, _ in buckets]
+    data = [round(value, 2) for _, value in buckets]
+    title = f"{measure} over time"
+    chart = {
+        "type": "line",
+        "title": title,
+        "data": {
+            "labels": labels,
+            "datasets": [{
+                "label": measure,
+                "data": data,
+                "borderColor": "#3B82F6",
+                "backgroundColor": "rgba(59, 130, 246, 0.1)",
+                "fill": True,
+                "tension": 0.4
+            }]
+        },
+        "options": _chart_options(title)
+    }
+    content = f"## {title}\n\n**Dataset:** {name} - {rows:,} rows, bucketed by {time_column}\n\n"
+    if data:
+        change = f" ({(data[-1] - data[0]) / abs(data[0]):+.1%})" if data[0] else ""
+        content += f"**Trend:** {data[0]:,.2f} in {labels[0]} to {data[-1]:,.2f} in {labels[-1]}{change}"
+    return {"content": content, "chart_data": chart}
+
+def _scatter_result(pairs: CorrelationAccumulator, x_column: str, y_column: str,
+                    rows: int, name: str) -> Dict[str, Any]:
+    _, xs, ys = pairs.sample
+    points = [{"x": round(x, 2), "y": round(y, 2)} for x, y in zip(xs.tolist(), ys.tolist())]
+    r = pairs.correlation()
+    title = f"{x_column} vs {y_column}"
+    chart = {
+        "type": "scatter",
+        "title": title,
+        "data": {
+            "datasets": [{
+                "label": "Data points" if len(points) == pairs.n else f"Sample of {len(points)} data points",
+                "data": points,
+                "backgroundColor": "#3B82F6",
+                "borderColor": "#1D4ED8"
+            }]
+        },
+        "options": {
+            **_chart_options(title),
+            "scales": {
+                "x": {"title": {"display": True, "text": x_column}},
+                "y": {"title": {"display": True, "text": y_column}}
+            }
+        }
+    }
+    correlation = "not enough variation to measure" if r is None else f"r = {r:.2f}"
+    content = (f"## {title}\n\n**Dataset:** {name} - {rows:,} rows, {pairs.n:,} with both values\n\n"
+               f"**Correlation:** {correlation}")
+    return {"content": content, "chart_data": chart}
+
+def is_csv_upload(info: Dict[str, Any]) -> bool:
+    """Whether an uploaded file can be analyzed"""
+    return (info["filename"] or "").lower().endswith(".csv") or info["content_type"] == "text/csv"
+
+def analyze_upload(file_id: str, user_query: str, chart_type: Optional[str] = None) -> Dict[str, Any]:
+    """Analyze an uploaded CSV for a query. Blocking - run it off the event loop."""
+    info = uploaded_files.get(file_id)
+    if info is None:
+        raise ValueError("The uploaded file is no longer available")
+    if not is_csv_upload(info):
+        raise ValueError(f"Only CSV files can be analyzed, not '{info['filename']}'")
+    # Parse each distinct upload once; later queries map the cached columns instead
+    dataset = column_cache.open(info["content_hash"])
+    if dataset is None:
+        csv_dataset = CsvDataset(info["path"])
+        dataset = column_cache.build(info["content_hash"], csv_dataset) or csv_dataset
+    return analyze_dataset(dataset, user_query, chart_type, name=info["filename"])
 
 def generate_chart_data(requested_type: str = None):
     """Generate interactive chart data for different visualization types"""
@@ -453,6 +2827,68 @@ def determine_response_type(user_query: str) -> str:
         print(f"DEBUG: Defaulting to chart for '{user_query}'")
         return "chart"
 
+async def fail_interrupted_job(job: Dict[str, Any], reason: str):
+    """Give up on a checkpointed job, leaving the session in a clean error state"""
+    sessions.update(job["session_id"], status="error")
+    await progress_logger.log_progress(
+        session_id=job["session_id"],
+        step="Error",
+        message=f"An error occurred: {reason}",
+        step_number=0,
+        total_steps=0
+    )
+    job_checkpoints.remove(job["job_id"])
+
+async def resume_interrupted_jobs(max_age: float = JOB_RESUME_MAX_AGE) -> Dict[str, int]:
+    """Requeue jobs checkpointed by a previous process; fail those too old to be worth finishing"""
+    resumed = failed = 0
+    for job in job_checkpoints.load_all():
+        session_id = job["session_id"]
+        # Sessions only live in memory - recreate enough of one for the client to follow along.
+        # Jobs come oldest first, so a session with several jobs gets its messages back in order
+        sessions.create(session_id, status="processing", **job["session"])
+        append_message(session_id, job["message"])
+        
+        age = (datetime.now() - datetime.fromisoformat(job["created_at"])).total_seconds()
+        if age > max_age:
+            await fail_interrupted_job(job, "the request was interrupted by a server restart")
+            failed += 1
+            continue
+        try:
+            job_scheduler.submit(job["user_email"], session_id,
+                                 lambda job=job: process_query_with_progress(
+                                     job["session_id"], job["user_query"], job["response_type"],
+                                     job=job, file_id=job.get("file_id")),
+                                 lane=job_lane_for(job["response_type"]))
+        except SchedulerLimitError as e:
+            await fail_interrupted_job(job, str(e))
+            failed += 1
+            continue
+        sessions.update(session_id, status="processing")
+        resumed += 1
+    return {"resumed": resumed, "failed": failed}
+
+background_tasks: List[asyncio.Task] = []
+
+@app.on_event("startup")
+async def start_background_tasks():
+    job_scheduler.start()
+    result = await resume_interrupted_jobs()
+    if result["resumed"] or result["failed"]:
+        print(f"Interrupted jobs: {result}")
+    background_tasks.append(asyncio.create_task(run_log_compactor()))
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    # Stop taking work, let running jobs finish, then cancel the rest - they and
+    # any queued jobs keep their checkpoints and resume on the next startup
+    result = await job_scheduler.shutdown(SHUTDOWN_GRACE_PERIOD)
+    if result["cancelled"] or result["dropped"]:
+        print(f"Jobs left for restart: {result}")
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+
 @app.get("/")
 def root():
     """Health check"""
@@ -464,32 +2900,70 @@ async def query_endpoint(request: QueryRequest):
     
     # Generate session ID
     session_id = request.session_id or str(uuid.uuid4())
+    user = normalize_user(request.user_email)
+    if request.file_id is not None:
+        if request.file_id not in uploaded_files:
+            raise HTTPException(status_code=404, detail="File not found")
+        if not is_csv_upload(uploaded_files[request.file_id]):
+            raise HTTPException(status_code=400, detail="Only CSV files can be analyzed")
+    
+    # Refuse work from users over their limits before touching the session
+    try:
+        job_scheduler.check_limits(user, session_id)
+    except SchedulerLimitError as e:
+        if e.reason == "shutting_down":
+            raise HTTPException(status_code=503, detail={"error": e.reason, "message": str(e)})
+        raise too_many_requests(e.reason, str(e))
+    retry_after = rate_limiter.try_acquire(user)
+    if retry_after:
+        raise too_many_requests("rate_limited", "Too many requests, please slow down", retry_after)
     
     # Create session if new
-    if session_id not in sessions:
-        sessions[session_id] = {
-            "session_id": session_id,
-            "title": create_session_title(request.user_query),
-            "created_at": datetime.now().isoformat(),
-            "last_activity": datetime.now().isoformat(),
-            "status": "processing",
-            "messages": []
-        }
+    now = datetime.now().isoformat()
+    sessions.create(
+        session_id,
+        title=create_session_title(request.user_query),
+        user_email=user,
+        created_at=now,
+        last_activity=now,
+        status="processing"
+    )
     
     # Update session
-    sessions[session_id]["last_activity"] = datetime.now().isoformat()
-    sessions[session_id]["status"] = "processing"
-    sessions[session_id]["messages"].append({
+    user_message = {
         "type": "user",
         "content": request.user_query,
-        "timestamp": datetime.now().isoformat()
-    })
+        "timestamp": now
+    }
+    append_message(session_id, user_message, status="processing", last_activity=now)
     
     # Determine response type based on query
     response_type = determine_response_type(request.user_query)
     
-    # Start background processing with progress logging
-    asyncio.create_task(process_query_with_progress(session_id, request.user_query, response_type))
+    # Checkpoint the job before queueing it so a restart can pick it back up
+    session = sessions[session_id]
+    job = {
+        "job_id": str(uuid.uuid4()),
+        "session_id": session_id,
+        "user_email": user,
+        "user_query": request.user_query,
+        "response_type": response_type,
+        "file_id": request.file_id,
+        "session": {"title": session["title"], "user_email": user,
+                    "created_at": session["created_at"], "last_activity": now},
+        "message": user_message,
+        "created_at": now,
+        "step": "Queued",
+        "results": {}
+    }
+    job_checkpoints.save(job)
+    
+    # Queue background processing with progress logging - jobs are shared fairly between users,
+    # and quick chart/text answers go ahead of heavy file exports
+    job_scheduler.submit(user, session_id,
+                         lambda: process_query_with_progress(session_id, request.user_query, response_type,
+                                                             job=job, file_id=request.file_id),
+                         lane=job_lane_for(response_type))
     
     # Return immediate response indicating processing has started
     return QueryResponse(
@@ -499,56 +2973,46 @@ async def query_endpoint(request: QueryRequest):
         response_type=response_type
     )
 
-async def process_query_with_progress(session_id: str, user_query: str, response_type: str):
-    """Process query in background with progress updates"""
+def generate_response(user_query: str, response_type: str, file_id: Optional[str] = None) -> Dict[str, Any]:
+    """Generate the assistant message payload for a query, from the uploaded file when one is given"""
+    # Other uploads (xlsx, pdf, ...) can't be analyzed - answer as if there were no file
+    info = uploaded_files.get(file_id) if file_id is not None else None
+    if file_id is not None and response_type in ("chart", "text") and (info is None or is_csv_upload(info)):
+        result = analyze_upload(file_id, user_query, determine_chart_type(user_query))
+        return result if response_type == "chart" else {"content": result["content"]}
+    if response_type == "chart":
+        requested_chart_type = determine_chart_type(user_query)
+        return {
+            "content": generate_mock_text_response(),
+            "chart_data": generate_chart_data(requested_chart_type)
+        }
+    elif response_type == "file":
+        file_info = generate_mock_file_response()
+        return {
+            "content": f"Your {file_info['file_type'].upper()} report has been generated and is ready for download.",
+            "file_info": file_info
+        }
+    else:  # text response
+        return {"content": generate_mock_text_response()}
+
+async def process_query_with_progress(session_id: str, user_query: str, response_type: str,
+                                      job: Optional[Dict[str, Any]] = None, file_id: Optional[str] = None):
+    """Process query in background with progress updates.
+
+    With a job record the job is checkpointed at every step boundary, and a
+    job resumed from its checkpoint skips the steps it already finished.
+    The checkpoint is removed once the job succeeds or fails; a cancelled
+    job (e.g. at shutdown) keeps it.
+    """
+    def checkpoint(step: str, **changes):
+        if job is not None:
+            job.update(step=step, **changes)
+            job_checkpoints.save(job)
+    
     try:
-        # Start progress logging
-        await progress_logger.log_progress(
-            session_id=session_id,
-            step="Starting",
-            message="Starting analysis of your request...",
-            step_number=0,
-            total_steps=6
-        )
-        
-        # Simulate analysis with progress
-        await simulate_analysis_with_progress(session_id, user_query, response_type)
-        
-        # Generate final response based on type
-        if response_type == "chart":
-            requested_chart_type = determine_chart_type(user_query)
-            chart_data = generate_chart_data(requested_chart_type)
-            response_content = generate_mock_text_response()
-            
-            sessions[session_id]["messages"].append({
-                "type": "assistant", 
-                "content": response_content,
-                "chart_data": chart_data,
-                "timestamp": datetime.now().isoformat()
-            })
-            
-        elif response_type == "file":
-            file_info = generate_mock_file_response()
-            response_content = f"Your {file_info['file_type'].upper()} report has been generated and is ready for download."
-            
-            sessions[session_id]["messages"].append({
-                "type": "assistant",
-                "content": response_content,
-                "file_info": file_info,
-                "timestamp": datetime.now().isoformat()
-            })
-            
-        else:  # text response
-            response_content = generate_mock_text_response()
-            sessions[session_id]["messages"].append({
-                "type": "assistant", 
-                "content": response_content,
-                "timestamp": datetime.now().isoformat()
-            })
-        
-        # Update session status
-        sessions[session_id]["status"] = "completed"
-        sessions[session_id]["last_activity"] = datetime.now().isoformat()
+        # A job interrupted after its answer was generated only re-stores it -
+        # sessions live in memory, so the restarted process has lost it
+        cache_details = await answer_query(session_id, user_query, response_type, job, checkpoint, file_id)
         
         # Only add notification if no active WebSocket connection (user not watching)
         if session_id not in progress_logger.active_connections:
@@ -563,12 +3027,13 @@ async def process_query_with_progress(session_id: str, user_query: str, response
             step="Finished",
             message="Response ready! Your analysis is complete.",
             step_number=6,
-            total_steps=6
+            total_steps=6,
+            details=cache_details
         )
         
     except Exception as e:
         print(f"Error processing query: {e}")
-        sessions[session_id]["status"] = "error"
+        sessions.update(session_id, status="error")
         await progress_logger.log_progress(
             session_id=session_id,
             step="Error",
@@ -576,33 +3041,181 @@ async def process_query_with_progress(session_id: str, user_query: str, response
             step_number=0,
             total_steps=0
         )
+    
+    if job is not None:
+        job_checkpoints.remove(job["job_id"])
+
+async def answer_query(session_id: str, user_query: str, response_type: str,
+                       job: Optional[Dict[str, Any]], checkpoint: Callable[..., None],
+                       file_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Run the analysis (or reuse a cached or checkpointed answer) and store the assistant message.
+    Returns the details to tag the final log entry with."""
+    cacheable = response_type not in UNCACHED_RESPONSE_TYPES
+    cache_key = query_cache.make_key(user_query, response_type, file_id)
+    result = query_cache.get(cache_key) if cacheable else None
+    cache_details = {"cached": True} if result is not None else None
+    resumed = job is not None and job["step"] != "Queued"
+    if result is None and job is not None:
+        # An interrupted run may have produced the answer already
+        result = job.get("result")
+    
+    # Start progress logging
+    starting_details = dict(cache_details or {})
+    if resumed:
+        starting_details["resumed"] = True
+    await progress_logger.log_progress(
+        session_id=session_id,
+        step="Starting",
+        message="Resuming analysis of your request..." if resumed else "Starting analysis of your request...",
+        step_number=0,
+        total_steps=6,
+        details=starting_details or None
+    )
+    checkpoint("Starting")
+    
+    def step_done(name: str, step_result: Any):
+        job["results"][name] = step_result
+        checkpoint(name)
+    
+    if result is None:
+        # Simulate analysis with progress, skipping steps finished before an interruption
+        await simulate_analysis_with_progress(session_id, user_query, response_type,
+                                              completed=job["results"] if job is not None else None,
+                                              on_step_done=step_done if job is not None else None,
+                                              yield_point=job_scheduler.yield_point)
+        
+        # Generate final response based on type - analyzing an upload is CPU-bound, keep it off the loop
+        if file_id is not None:
+            result = await asyncio.to_thread(generate_response, user_query, response_type, file_id)
+        else:
+            result = generate_response(user_query, response_type)
+        if cacheable:
+            query_cache.put(cache_key, result)
+        checkpoint("Responding", result=result)
+    else:
+        # Same analysis already ran recently (or before a restart) - skip straight to the answer
+        await progress_logger.log_progress(
+            session_id=session_id,
+            step="Completed",
+            message="Found a recent result for this request." if cache_details else
+                    "Recovered the result prepared before the interruption.",
+            step_number=6,
+            total_steps=6,
+            details=cache_details
+        )
+    
+    # Store the answer and mark the session completed in one update
+    now = datetime.now().isoformat()
+    append_message(session_id, {
+        "type": "assistant",
+        **result,
+        "timestamp": now
+    }, status="completed", last_activity=now)
+    return cache_details
+
+async def _receive_until_disconnect(connection: ProgressConnection):
+    """Treat any client frame (normally a pong) as a sign of life"""
+    try:
+        while True:
+            await connection.websocket.receive_text()
+            connection.touch()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"WebSocket error: {e}")
+
+async def _heartbeat(connection: ProgressConnection):
+    """Ping the client periodically and reap it if it stops answering"""
+    while True:
+        await asyncio.sleep(WS_PING_INTERVAL)
+        if WS_PONG_TIMEOUT and connection.idle_for() > WS_PING_INTERVAL + WS_PONG_TIMEOUT:
+            await connection.close(code=1001, reason="Heartbeat timeout")
+            return
+        try:
+            await connection.send_text(json.dumps({"type": "ping", "timestamp": connection.clock.now().isoformat()}))
+        except Exception as e:
+            print(f"Error sending WebSocket ping: {e}")
+            return
 
 @app.websocket("/ws/progress/{session_id}")
-async def websocket_progress(websocket: WebSocket, session_id: str):
-    """WebSocket endpoint for real-time progress updates"""
+async def websocket_progress(websocket: WebSocket, session_id: str, framing: str = "single",
+                             batch_window_ms: Optional[int] = None):
+    """WebSocket endpoint for real-time progress updates.
+
+    framing="batch" opts into array frames that coalesce entries logged within
+    batch_window_ms of each other (and the whole reconnect replay).
+    """
     await websocket.accept()
-    progress_logger.active_connections[session_id] = websocket
     
+    if framing not in ("single", "batch"):
+        await websocket.close(code=1008, reason=f"Unsupported framing '{framing}'")
+        return
+    batch_window = WS_BATCH_WINDOW if batch_window_ms is None else batch_window_ms / 1000
+    batch_window = min(max(batch_window, 0.0), WS_MAX_BATCH_WINDOW)
+    
+    limit_reason = progress_logger.connection_limit_reason(session_id)
+    if limit_reason:
+        await websocket.close(code=1013, reason=limit_reason)
+        return
+    
+    connection = progress_logger.register_connection(session_id, websocket, framing, batch_window)
+    tasks = []
     try:
         # Send existing progress logs when client connects
         existing_logs = progress_logger.get_progress_logs(session_id)
-        for log in existing_logs:
-            await websocket.send_text(json.dumps(log))
+        await connection.send_entries([json.dumps(log) for log in existing_logs])
         
-        # Keep connection alive
-        while True:
-            try:
-                await websocket.receive_text()
-            except WebSocketDisconnect:
-                break
-            except Exception as e:
-                print(f"WebSocket error: {e}")
-                break
+        # Job already finished - the replay was everything the client needs. The
+        # session status decides: a follow-up query may still be queued behind
+        # an earlier job whose terminal entry is the last one logged.
+        session = sessions.get(session_id)
+        if session is not None:
+            job_done = session["status"] != "processing"
+        else:
+            job_done = bool(existing_logs) and existing_logs[-1]["step"] in TERMINAL_STEPS
+        if WS_CLOSE_ON_COMPLETE and job_done:
+            await connection.close(reason="Job complete")
+            return
+        
+        # Keep connection alive until the client leaves, stops answering pings,
+        # or the job finishes and closes it
+        tasks = [
+            asyncio.create_task(_receive_until_disconnect(connection)),
+            asyncio.create_task(_heartbeat(connection)),
+            asyncio.create_task(connection.closed.wait())
+        ]
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
     except WebSocketDisconnect:
         pass
     finally:
-        if session_id in progress_logger.active_connections:
-            del progress_logger.active_connections[session_id]
+        for task in tasks:
+            task.cancel()
+        progress_logger.unregister_connection(connection)
+
+@app.get("/api/progress")
+async def query_progress(step: Optional[str] = None, status: Optional[str] = None,
+                         session_id: Optional[str] = None, since: Optional[datetime] = None,
+                         until: Optional[datetime] = None,
+                         limit: int = Query(100, ge=1, le=MAX_PROGRESS_QUERY_LIMIT)):
+    """Search recently logged progress entries across sessions, newest first.
+
+    status is one of "running", "finished" or "error". Step durations are
+    aggregated over every step run since startup, not only matching entries.
+    """
+    if status is not None and status not in ("running", "finished", "error"):
+        raise HTTPException(status_code=400, detail=f"Unknown status '{status}'")
+    # Log timestamps are naive local time
+    since, until = [value.astimezone().replace(tzinfo=None) if value and value.tzinfo else value
+                    for value in (since, until)]
+    entries, truncated = progress_logger.index.query(step=step, status=status, session_id=session_id,
+                                                     since=since, until=until, limit=limit)
+    return {
+        "entries": entries,
+        "count": len(entries),
+        "truncated": truncated,
+        "sessions": sorted({entry["session_id"] for entry in entries}),
+        "durations": progress_logger.index.duration_summary(step)
+    }
 
 @app.get("/api/progress/{session_id}")
 async def get_progress(session_id: str):
@@ -611,13 +3224,24 @@ async def get_progress(session_id: str):
     return {"session_id": session_id, "logs": logs}
 
 @app.get("/api/sessions", response_model=List[SessionInfo])
-def get_sessions():
-    """Get all user sessions with notification status"""
+def get_sessions(user_email: Optional[str] = None):
+    """Get sessions with notification status.
+
+    With user_email only that user's sessions are returned, most recently
+    active first, at a cost proportional to their own session count; the
+    frontend always passes it. Without it every session in the process is
+    listed - an admin/back-compat path that scans the whole store.
+    """
+    if user_email is None:
+        candidates = sessions.snapshot_all()
+    else:
+        candidates = sessions.sessions_for_user(normalize_user(user_email))
+    
     session_list = []
-    for session in sessions.values():
+    for session in candidates:
         # Check if session has unread notifications
         notification = progress_logger.get_notifications(session["session_id"])
-        has_notification = notification and not notification.get("read", True)
+        has_notification = bool(notification) and not notification.get("read", True)
         
         session_list.append(SessionInfo(
             session_id=session["session_id"],
@@ -631,18 +3255,62 @@ def get_sessions():
     return session_list
 
 @app.get("/api/sessions/{session_id}")
-def get_session(session_id: str):
-    """Get specific session details and mark notifications as read"""
-    if session_id not in sessions:
+def get_session(session_id: str,
+                limit: Optional[int] = Query(None, ge=1, le=MAX_MESSAGE_PAGE_SIZE),
+                cursor: Optional[str] = None,
+                attachments: str = Query("inline", pattern="^(inline|ref)$")):
+    """Get specific session details and mark notifications as read.
+
+    Without limit the whole history is returned. With limit, messages are
+    paged backwards from the newest one: each page is in chronological
+    order and next_cursor fetches the page of older messages before it.
+    attachments="ref" replaces chart_data/file_info with URLs that can be
+    fetched on demand.
+    """
+    snapshot = sessions.get(session_id)
+    if snapshot is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
     # Mark notifications as read when session is accessed
     progress_logger.mark_notification_read(session_id)
     
-    session_data = sessions[session_id].copy()
+    session_data = dict(snapshot)
+    messages = snapshot["messages"]
+    total_messages = len(messages)
+    
+    end = total_messages
+    if cursor is not None:
+        if not cursor.isdigit() or int(cursor) > total_messages:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        end = int(cursor)
+    start = 0 if limit is None else max(0, end - limit)
+    
+    session_data["messages"] = [message_view(session_id, message, attachments) for message in messages[start:end]]
+    if limit is not None or cursor is not None:
+        session_data["total_messages"] = total_messages
+        session_data["has_more"] = start > 0
+        session_data["next_cursor"] = str(start) if start > 0 else None
     session_data["notification"] = progress_logger.get_notifications(session_id)
     return session_data
 
+@app.get("/api/sessions/{session_id}/messages/{message_id}/attachments/{name}")
+def get_message_attachment(session_id: str, message_id: str, name: str):
+    """Fetch a chart or file attachment that get_session returned as a reference"""
+    snapshot = sessions.get(session_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if name not in ATTACHMENT_FIELDS:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    
+    # Recent messages are the ones being opened, so search from the end
+    for message in reversed(snapshot["messages"]):
+        if message.get("message_id") == message_id:
+            attachment = resolve_message(message, [name]).get(name)
+            if attachment is None:
+                raise HTTPException(status_code=404, detail="Attachment not found")
+            return attachment
+    raise HTTPException(status_code=404, detail="Message not found")
+
 @app.post("/api/sessions/{session_id}/mark-read")
 def mark_notification_read(session_id: str):
     """Mark session notifications as read"""
@@ -655,28 +3323,76 @@ def mark_notification_read(session_id: str):
 @app.delete("/api/sessions/{session_id}")
 def delete_session(session_id: str):
     """Delete a session"""
-    if session_id not in sessions:
+    session = sessions.delete(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Session not found")
-    del sessions[session_id]
+    for message in session["messages"]:
+        release_message(message)
+    progress_logger.delete_logs(session_id)
     return {"message": "Session deleted successfully"}
 
 @app.post("/api/upload")
 def upload_file(file: UploadFile = File(...)):
-    """Handle file uploads"""
+    """Handle file uploads - the content is kept on disk for later queries to analyze"""
     file_id = str(uuid.uuid4())
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    path = os.path.join(UPLOADS_DIR, file_id)
+    digest = hashlib.sha256()
+    with open(path, 'wb') as f:
+        while True:
+            block = file.file.read(1024 * 1024)
+            if not block:
+                break
+            digest.update(block)
+            f.write(block)
     uploaded_files[file_id] = {
         "filename": file.filename,
         "content_type": file.content_type,
-        "upload_time": datetime.now().isoformat()
+        "upload_time": datetime.now().isoformat(),
+        "path": path,
+        "size": os.path.getsize(path),
+        "content_hash": digest.hexdigest()
     }
     
     return {
         "file_id": file_id,
         "filename": file.filename,
         "message": f"File '{file.filename}' uploaded successfully",
-        "status": "uploaded"
+        "status": "uploaded",
+        "analyzable": is_csv_upload(uploaded_files[file_id])
     }
 
+@app.get("/api/stats/blobs")
+def get_blob_stats():
+    """Memory saved by interning repeated response texts and chart payloads"""
+    return blob_store.stats()
+
+@app.get("/api/stats/scheduler")
+def get_scheduler_stats():
+    """Running and queued background jobs"""
+    return job_scheduler.stats()
+
+@app.get("/api/stats/columns")
+def get_column_cache_stats():
+    """Parsed upload cache usage"""
+    return column_cache.stats()
+
+@app.get("/api/stats/logs")
+def get_log_storage_stats():
+    """Compacted progress log storage"""
+    return progress_logger.segments.stats() if progress_logger.segments else {}
+
+@app.get("/api/cache/stats")
+def get_cache_stats():
+    """Query result cache hit/miss statistics"""
+    return query_cache.stats()
+
+@app.delete("/api/cache")
+def invalidate_cache(user_query: Optional[str] = None):
+    """Invalidate cached results for one query, or the whole cache"""
+    removed = query_cache.invalidate(user_query)
+    return {"message": "Cache invalidated", "invalidated": removed}
+
 @app.get("/api/download/{file_id}")
 def download_file(file_id: str):
     """Mock file download"""
@@ -685,10 +3401,10 @@ def download_file(file_id: str):
 @app.get("/api/status/{session_id}")
 def get_status(session_id: str):
     """Get session status"""
-    if session_id not in sessions:
+    session = sessions.get(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    session = sessions[session_id]
     return {
         "session_id": session_id,
         "status": session["status"],
@@ -698,4 +3414,5 @@ def get_status(session_id: str):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001) 
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8001,
+                ws=build_websocket_protocol(), ws_per_message_deflate=WS_PER_MESSAGE_DEFLATE) 
\ No newline at end of file
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import JobCheckpointStore, LogSegmentStore
+
+
+@pytest.fixture(autouse=True)
+def isolated_job_checkpoints(tmp_path_factory, monkeypatch):
+    # Jobs left over by one test would otherwise be resumed by the next app startup
+    monkeypatch.setattr(app_module, "job_checkpoints", JobCheckpointStore(str(tmp_path_factory.mktemp("checkpoints"))))
+    monkeypatch.setattr(app_module, "SHUTDOWN_GRACE_PERIOD", 0)
+
+
+
+@pytest.fixture(autouse=True)
+def isolated_progress_logs(tmp_path_factory, monkeypatch):
+    # Tests import the global logger by name, so redirect it in place rather than replacing it
+    logs_dir = str(tmp_path_factory.mktemp("logs"))
+    monkeypatch.setattr(app_module.progress_logger, "logs_dir", logs_dir)
+    monkeypatch.setattr(app_module.progress_logger, "segments", LogSegmentStore(os.path.join(logs_dir, "segments")))
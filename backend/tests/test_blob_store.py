@@ -0,0 +1,57 @@
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import BlobStore, app, append_message, generate_chart_data, resolve_message, sessions
+
+
+def test_identical_values_are_stored_once():
+    store = BlobStore()
+    chart = generate_chart_data("pie")
+
+    keys = [store.put(generate_chart_data("pie")) for _ in range(10)]
+
+    assert len(set(keys)) == 1
+    assert store.get(keys[0]) == chart
+    stats = store.stats()
+    assert stats["blobs"] == 1 and stats["references"] == 10
+    assert stats["saved_bytes"] == 9 * stats["stored_bytes"]
+
+
+def test_last_release_removes_blob():
+    store = BlobStore()
+    key = store.put("same answer")
+    store.put("same answer")
+
+    store.release(key)
+    assert store.get(key) == "same answer"
+
+    store.release(key)
+    with pytest.raises(KeyError):
+        store.get(key)
+    assert store.stats()["logical_bytes"] == 0
+
+
+def test_session_messages_share_payloads_and_release_on_delete():
+    for session_id in ("blob-a", "blob-b"):
+        sessions.create(session_id, title="t", created_at="", last_activity="", status="completed")
+        append_message(session_id, {"type": "assistant", "content": "Shared analysis text",
+                                    "chart_data": generate_chart_data("bar"), "timestamp": ""})
+
+    first, second = sessions["blob-a"]["messages"][0], sessions["blob-b"]["messages"][0]
+    assert "chart_data" not in first
+    assert first["blob_refs"] == second["blob_refs"]
+    assert resolve_message(first)["content"] == "Shared analysis text"
+
+    chart_key = first["blob_refs"]["chart_data"]
+    with TestClient(app) as client:
+        client.delete("/api/sessions/blob-a")
+        assert app_module.blob_store.get(chart_key)["type"] == "bar"
+        client.delete("/api/sessions/blob-b")
+    with pytest.raises(KeyError):
+        app_module.blob_store.get(chart_key)
@@ -0,0 +1,146 @@
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import ColumnarCache, CsvDataset, analyze_dataset, app, generate_response
+
+
+def write_csv(path, rows=500, offset=0):
+    lines = ["city,amount,day"]
+    lines += [f"{['Oslo', 'Rome', 'Lima'][i % 3]},{i + offset},2024-0{i % 3 + 1}-01" for i in range(rows)]
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+@pytest.mark.parametrize("chart_type", ["bar", "pie", "line"])
+def test_cached_columns_give_same_results_as_parsing(tmp_path, chart_type):
+    path = write_csv(tmp_path / "data.csv")
+    cache = ColumnarCache(str(tmp_path / "cache"))
+    cached = cache.build("hash-a", CsvDataset(path, chunk_rows=64))
+
+    query = "chart of amount by city"
+    expected = analyze_dataset(CsvDataset(path, chunk_rows=64), query, chart_type)
+    assert analyze_dataset(cached, query, chart_type) == expected
+
+
+def test_columns_are_memory_mapped_and_text_is_dictionary_encoded(tmp_path):
+    path = write_csv(tmp_path / "data.csv")
+    cache = ColumnarCache(str(tmp_path / "cache"))
+    cache.build("hash-a", CsvDataset(path))
+
+    dataset = cache.open("hash-a")
+    chunk = next(dataset.iter_chunks())
+    assert isinstance(chunk["amount"], np.memmap)
+    assert chunk["city"].dtype == np.int32
+    assert [dataset.label("city", code) for code in chunk["city"][:3]] == ["Oslo", "Rome", "Lima"]
+    assert chunk["day"].dtype == np.dtype("datetime64[s]")
+    assert dataset.rows == 500
+    assert cache.stats()["hits"] == 1
+
+    # Entries survive a restart
+    assert ColumnarCache(str(tmp_path / "cache")).open("hash-a").rows == 500
+
+
+def test_high_cardinality_text_columns_are_capped(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, "MAX_GROUP_KEYS", 50)
+    path = tmp_path / "orders.csv"
+    path.write_text("order_id,amount\n" + "".join(f"o{i},1\n" for i in range(1000)))
+    cache = ColumnarCache(str(tmp_path / "cache"))
+
+    dataset = cache.build("hash-a", CsvDataset(str(path), chunk_rows=100))
+
+    assert dataset.cardinality("order_id") == 51
+    chunk = np.concatenate([chunk["order_id"] for chunk in dataset.iter_chunks()])
+    assert dataset.label("order_id", chunk[-1]) == "(other)"
+    chart = analyze_dataset(dataset, "count by order_id", "pie")["chart_data"]
+    assert sum(chart["data"]["datasets"][0]["data"]) == 1000
+
+
+def test_least_recently_opened_entries_are_evicted(tmp_path):
+    cache = ColumnarCache(str(tmp_path / "cache"))
+    for name in "abc":
+        cache.build(name, CsvDataset(write_csv(tmp_path / f"{name}.csv")))
+    entry_bytes = cache.stats()["bytes"] // 3
+    cache.max_bytes = entry_bytes * 3
+
+    cache.open("a")
+    cache.build("d", CsvDataset(write_csv(tmp_path / "d.csv")))
+
+    assert cache.open("b") is None
+    assert all(cache.open(name) is not None for name in "acd")
+    assert cache.stats()["evictions"] == 1
+    assert not os.path.exists(cache.get_entry_dir("b"))
+
+
+def test_oversized_and_unfinished_entries_are_not_kept(tmp_path):
+    cache = ColumnarCache(str(tmp_path / "cache"), max_bytes=100)
+    assert cache.build("big", CsvDataset(write_csv(tmp_path / "big.csv"))) is None
+    assert os.listdir(tmp_path / "cache") == []
+
+    os.makedirs(tmp_path / "cache" / "crashed")
+    assert ColumnarCache(str(tmp_path / "cache")).stats()["entries"] == 0
+    assert os.listdir(tmp_path / "cache") == []
+
+
+def test_entries_are_shared_between_processes(tmp_path):
+    # Two caches on one directory stand in for two worker processes
+    first = ColumnarCache(str(tmp_path / "cache"))
+    second = ColumnarCache(str(tmp_path / "cache"))
+    first.build("shared", CsvDataset(write_csv(tmp_path / "data.csv")))
+
+    assert second.open("shared").rows == 500
+    # Losing the rename race to the other process reuses its entry
+    assert second.build("shared", CsvDataset(write_csv(tmp_path / "data.csv"))).rows == 500
+    assert second.stats()["entries"] == 1
+    assert sorted(os.listdir(tmp_path / "cache")) == ["shared"]
+
+
+def test_eviction_sees_entries_from_other_processes(tmp_path):
+    first = ColumnarCache(str(tmp_path / "cache"))
+    second = ColumnarCache(str(tmp_path / "cache"))
+    first.build("a", CsvDataset(write_csv(tmp_path / "a.csv")))
+    second.build("b", CsvDataset(write_csv(tmp_path / "b.csv")))
+    second.max_bytes = second.stats()["bytes"]
+
+    second.build("c", CsvDataset(write_csv(tmp_path / "c.csv")))
+
+    assert sorted(os.listdir(tmp_path / "cache")) == ["b", "c"]
+    assert first.open("a") is None
+
+
+def test_only_stale_build_directories_are_cleared(tmp_path):
+    cache_dir = tmp_path / "cache"
+    os.makedirs(cache_dir / ".build-live")
+    os.makedirs(cache_dir / ".build-crashed")
+    (cache_dir / ".build-crashed" / "col0.bin").write_bytes(b"x")
+    old = time.time() - 2 * app_module.COLUMN_CACHE_STALE_BUILD
+    for path in (cache_dir / ".build-crashed" / "col0.bin", cache_dir / ".build-crashed"):
+        os.utime(path, (old, old))
+
+    ColumnarCache(str(cache_dir))
+
+    assert os.listdir(cache_dir) == [".build-live"]
+
+
+def test_repeat_uploads_reuse_parsed_columns(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, "UPLOADS_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(app_module, "column_cache", ColumnarCache(str(tmp_path / "cache")))
+    content = open(write_csv(tmp_path / "data.csv"), "rb").read()
+    with TestClient(app) as client:
+        file_ids = [client.post("/api/upload", files={"file": ("data.csv", io.BytesIO(content), "text/csv")})
+                    .json()["file_id"] for _ in range(2)]
+
+        first = generate_response("bar chart of amount by city", "chart", file_ids[0])
+        second = generate_response("bar chart of amount by city", "chart", file_ids[1])
+
+        assert first == second
+        assert client.get("/api/stats/columns").json() | {"bytes": 0, "max_bytes": 0} == {
+            "entries": 1, "bytes": 0, "max_bytes": 0, "hits": 1, "misses": 1, "evictions": 0}
@@ -0,0 +1,75 @@
+import os
+import sys
+import zlib
+
+import pytest
+from fastapi.testclient import TestClient
+from websockets import frames
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import CompressionMiddleware, app, build_websocket_protocol, sessions
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def large_session():
+    sessions.create("compression-test", title="Compression test", created_at="2024-01-01T00:00:00",
+                    last_activity="2024-01-01T00:00:00", status="completed")
+    for _ in range(20):
+        sessions.append_message("compression-test", {"type": "assistant", "content": "Revenue by region " * 50,
+                                                     "timestamp": "2024-01-01T00:00:00"})
+    yield "compression-test"
+    sessions.delete("compression-test")
+
+
+def test_large_json_response_is_gzipped(client, large_session):
+    response = client.get(f"/api/sessions/{large_session}", headers={"Accept-Encoding": "gzip"})
+
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert int(response.headers["content-length"]) < len(response.content) / 5
+    assert len(response.json()["messages"]) == 20
+
+
+def test_small_response_is_not_compressed(client):
+    response = client.get("/", headers={"Accept-Encoding": "gzip"})
+
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+
+
+def test_identity_when_client_does_not_accept_compression(client, large_session):
+    response = client.get(f"/api/sessions/{large_session}", headers={"Accept-Encoding": "identity"})
+
+    assert "content-encoding" not in response.headers
+
+
+def test_encoding_negotiation():
+    assert CompressionMiddleware.choose_encoding("gzip, deflate") == "gzip"
+    assert CompressionMiddleware.choose_encoding("gzip;q=0, deflate") is None
+    assert CompressionMiddleware.choose_encoding("") is None
+    expected = "br" if app_module.brotli is not None else "gzip"
+    assert CompressionMiddleware.choose_encoding("br, gzip") == expected
+
+
+def test_websocket_deflate_skips_small_frames():
+    factory = build_websocket_protocol().extension_factory(compress_settings={"level": 6})
+    _, extension = factory.process_request_params([], [])
+
+    small = extension.encode(frames.Frame(frames.Opcode.TEXT, b'{"step": "Analyzing"}'))
+    assert not small.rsv1
+
+    payload = b'{"step": "Executing code", "message": "Running analysis..."}' * 50
+    large = extension.encode(frames.Frame(frames.Opcode.TEXT, payload))
+    assert large.rsv1
+    assert len(large.data) < len(payload)
+    decoder = zlib.decompressobj(wbits=-15)
+    assert decoder.decompress(large.data + b"\x00\x00\xff\xff") == payload
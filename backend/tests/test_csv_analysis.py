@@ -0,0 +1,187 @@
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import (
+    ColumnarCache,
+    CorrelationAccumulator,
+    CsvDataset,
+    analyze_dataset,
+    app,
+    generate_response,
+)
+
+REGIONS = ["North", "South", "East", "West"]
+
+
+@pytest.fixture
+def sales_csv(tmp_path):
+    rng = np.random.default_rng(1)
+    rows = 1000
+    regions = [REGIONS[i % 4] for i in range(rows)]
+    revenue = rng.uniform(10, 100, rows).round(2)
+    units = (revenue * 2 + rng.normal(0, 5, rows)).round(2)
+    months = [f"2024-{(i % 6) + 1:02d}-15" for i in range(rows)]
+    lines = ["region,revenue,order_date,units"]
+    lines += [f"{r},{v},{d},{u}" for r, v, d, u in zip(regions, revenue, months, units)]
+    path = tmp_path / "sales.csv"
+    path.write_text("\n".join(lines) + "\n")
+    return str(path), regions, revenue, months, units
+
+
+def test_column_kinds_and_chunking(sales_csv):
+    path, regions, revenue, _, _ = sales_csv
+    dataset = CsvDataset(path, chunk_rows=128)
+
+    assert dataset.kinds == {"region": "text", "revenue": "number", "order_date": "datetime", "units": "number"}
+    chunks = list(dataset.iter_chunks())
+    assert [len(chunk["revenue"]) for chunk in chunks] == [128] * 7 + [104]
+    assert np.concatenate([chunk["revenue"] for chunk in chunks]) == pytest.approx(revenue)
+    assert chunks[0]["order_date"].dtype == np.dtype("datetime64[s]")
+
+
+def test_group_by_sum_matches_across_chunks(sales_csv):
+    path, regions, revenue, _, _ = sales_csv
+
+    result = analyze_dataset(CsvDataset(path, chunk_rows=97), "bar chart of revenue by region", "bar")
+
+    chart = result["chart_data"]
+    expected = {region: revenue[[r == region for r in regions]].sum() for region in REGIONS}
+    assert chart["type"] == "bar"
+    assert dict(zip(chart["data"]["labels"], chart["data"]["datasets"][0]["data"])) == \
+        pytest.approx({k: round(v, 2) for k, v in expected.items()})
+    assert chart["title"] == "Sum of revenue by region"
+    assert "1,000 rows" in result["content"]
+
+
+def test_average_pie_and_monthly_line(sales_csv):
+    path, regions, revenue, months, _ = sales_csv
+    dataset = CsvDataset(path, chunk_rows=300)
+
+    pie = analyze_dataset(dataset, "average revenue distribution", "pie")["chart_data"]
+    north = revenue[[r == "North" for r in regions]].mean()
+    assert pie["data"]["datasets"][0]["data"][pie["data"]["labels"].index("North")] == pytest.approx(round(north, 2))
+
+    line = analyze_dataset(dataset, "revenue trend", "line")["chart_data"]
+    assert line["data"]["labels"] == ["Jan 2024", "Feb 2024", "Mar 2024", "Apr 2024", "May 2024", "Jun 2024"]
+    january = revenue[[m.startswith("2024-01") for m in months]].sum()
+    assert line["data"]["datasets"][0]["data"][0] == pytest.approx(round(january, 2))
+
+
+def test_weekly_buckets_start_on_monday(tmp_path):
+    path = tmp_path / "daily.csv"
+    # Sun 2024-01-07 through Mon 2024-01-15
+    path.write_text("day,amount\n" + "".join(f"2024-01-{d:02d},1\n" for d in range(7, 16)))
+
+    line = analyze_dataset(CsvDataset(str(path)), "weekly amount", "line")["chart_data"]
+
+    assert line["data"]["labels"] == ["Week of 2024-01-01", "Week of 2024-01-08", "Week of 2024-01-15"]
+    assert line["data"]["datasets"][0]["data"] == [1, 7, 1]
+
+
+def test_scatter_correlation_and_sample(sales_csv):
+    path, _, revenue, _, units = sales_csv
+
+    result = analyze_dataset(CsvDataset(path, chunk_rows=64), "correlation of revenue and units", "scatter")
+
+    points = result["chart_data"]["data"]["datasets"][0]["data"]
+    assert len(points) == 500
+    r = np.corrcoef(revenue, units)[0, 1]
+    assert f"r = {r:.2f}" in result["content"]
+
+
+def test_streaming_correlation_is_stable_for_large_offsets():
+    rng = np.random.default_rng(2)
+    x = rng.normal(1e9, 1, 10000)
+    y = x + rng.normal(0, 1, 10000)
+    pairs = CorrelationAccumulator()
+    for start in range(0, 10000, 999):
+        pairs.add(x[start:start + 999], y[start:start + 999])
+
+    assert pairs.n == 10000
+    assert pairs.correlation() == pytest.approx(np.corrcoef(x, y)[0, 1], abs=1e-6)
+
+
+def test_blank_bad_and_ragged_values_are_skipped(tmp_path):
+    path = tmp_path / "messy.csv"
+    path.write_text("team,score\nA,1\nA,\nB,2\nB,oops\nC\nA,3,extra\n")
+
+    chart = analyze_dataset(CsvDataset(str(path), chunk_rows=2), "bar chart", "bar")["chart_data"]
+
+    assert dict(zip(chart["data"]["labels"], chart["data"]["datasets"][0]["data"])) == {"A": 4.0, "B": 2.0}
+
+
+def test_unsupported_chart_type_falls_back(tmp_path):
+    path = tmp_path / "no_dates.csv"
+    path.write_text("team,score\nA,1\nB,2\n")
+
+    assert analyze_dataset(CsvDataset(str(path)), "trend", "line")["chart_data"]["type"] == "bar"
+
+    numbers_only = tmp_path / "single.csv"
+    numbers_only.write_text("score\n1\n2\n")
+    with pytest.raises(ValueError):
+        analyze_dataset(CsvDataset(str(numbers_only)), "chart", None)
+
+
+def test_identifier_columns_are_not_used_as_categories(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, "MAX_GROUP_KEYS", 50)
+    path = tmp_path / "orders.csv"
+    path.write_text("order_id,region,amount\n" +
+                    "".join(f"o{i},{REGIONS[i % 4]},1\n" for i in range(1000)))
+
+    chart = analyze_dataset(CsvDataset(str(path)), "bar chart of amount by order_id", "bar")["chart_data"]
+
+    assert sorted(chart["data"]["labels"]) == sorted(REGIONS)
+
+
+def test_high_cardinality_groups_spill_into_other(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, "MAX_GROUP_KEYS", 50)
+    path = tmp_path / "orders.csv"
+    path.write_text("order_id,amount\n" + "".join(f"o{i},1\n" for i in range(1000)))
+
+    groups = app_module.GroupAggregate(max_groups=50)
+    for chunk in CsvDataset(str(path), chunk_rows=100).iter_chunks():
+        groups.add(chunk["order_id"], chunk["amount"])
+
+    assert len(groups.groups) == 50
+    totals = groups.result("sum")
+    assert totals["(other)"] == 950 and sum(totals.values()) == 1000
+    chart = analyze_dataset(CsvDataset(str(path)), "count by order_id", "pie")["chart_data"]
+    assert sum(chart["data"]["datasets"][0]["data"]) == 1000
+
+
+def test_uploaded_csv_answers_queries(sales_csv, tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, "UPLOADS_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(app_module, "column_cache", ColumnarCache(str(tmp_path / "cache")))
+    path = sales_csv[0]
+    with TestClient(app) as client:
+        with open(path, "rb") as f:
+            upload = client.post("/api/upload", files={"file": ("sales.csv", f, "text/csv")}).json()
+
+        chart = generate_response("pie chart of revenue by region", "chart", upload["file_id"])
+        assert chart["chart_data"]["type"] == "pie"
+        assert sorted(chart["chart_data"]["data"]["labels"]) == sorted(REGIONS)
+        text = generate_response("summary of revenue", "text", upload["file_id"])
+        assert set(text) == {"content"} and "sales.csv" in text["content"]
+
+        response = client.post("/api/query", json={"user_query": "bar chart", "user_email": "a@example.com",
+                                                   "file_id": "missing"})
+        assert response.status_code == 404
+
+        assert upload["analyzable"] is True
+        pdf = client.post("/api/upload", files={"file": ("report.pdf", io.BytesIO(b"%PDF"), "application/pdf")}).json()
+        assert pdf["analyzable"] is False
+        with pytest.raises(ValueError):
+            app_module.analyze_upload(pdf["file_id"], "bar chart")
+        response = client.post("/api/query", json={"user_query": "bar chart", "user_email": "a@example.com",
+                                                   "file_id": pdf["file_id"]})
+        assert response.status_code == 400
+        # A job that already carries a non-CSV file_id still gets an answer
+        assert "chart_data" in generate_response("bar chart", "chart", pdf["file_id"])
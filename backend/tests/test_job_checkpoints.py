@@ -0,0 +1,209 @@
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import (
+    FairJobScheduler,
+    ProgressLogger,
+    SchedulerLimitError,
+    TokenBucketRateLimiter,
+    VirtualClock,
+    app,
+    process_query_with_progress,
+    resume_interrupted_jobs,
+    sessions,
+    simulate_analysis_with_progress,
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = VirtualClock()
+    monkeypatch.setattr(app_module, "progress_logger", ProgressLogger(logs_dir=None, clock=clock))
+    monkeypatch.setattr(app_module, "job_scheduler",
+                        FairJobScheduler(max_concurrent_jobs=4, max_jobs_per_user=4, max_sessions_per_user=4))
+    return clock
+
+
+def new_job(session_id, query="Show me a bar chart", response_type="chart", created_at=None):
+    created_at = created_at or datetime.now().isoformat()
+    message = {"type": "user", "content": query, "timestamp": created_at}
+    sessions.delete(session_id)
+    sessions.create(session_id, title="t", user_email="dana@example.com", created_at=created_at,
+                    last_activity=created_at, status="processing")
+    app_module.append_message(session_id, message)
+    job = {
+        "job_id": f"job-{session_id}",
+        "session_id": session_id,
+        "user_email": "dana@example.com",
+        "user_query": query,
+        "response_type": response_type,
+        "session": {"title": "t", "user_email": "dana@example.com",
+                    "created_at": created_at, "last_activity": created_at},
+        "message": message,
+        "created_at": created_at,
+        "step": "Queued",
+        "results": {}
+    }
+    app_module.job_checkpoints.save(job)
+    return job
+
+
+def test_pipeline_skips_steps_completed_before_interruption():
+    clock = VirtualClock()
+    logger = ProgressLogger(logs_dir=None, clock=clock)
+
+    clock.run(simulate_analysis_with_progress("partial", "q", "chart", logger=logger,
+                                              completed={"Scanning databases": None, "Analyzing": None}))
+
+    assert clock.time() == 1.5
+    steps = [(log["step"], log["step_number"]) for log in logger.get_progress_logs("partial")]
+    assert steps[0] in [("Fetching relevant data", 3), ("Writing code", 3)]
+    assert "Analyzing" not in [step for step, _ in steps]
+
+
+def test_job_is_checkpointed_at_each_step_and_removed_when_done(clock, monkeypatch):
+    app_module.query_cache.invalidate()
+    job = new_job("ckpt-steps")
+    saved_steps = []
+    save = app_module.job_checkpoints.save
+    monkeypatch.setattr(app_module.job_checkpoints, "save",
+                        lambda job: (saved_steps.append(job["step"]), save(job)))
+
+    clock.run(process_query_with_progress("ckpt-steps", job["user_query"], "chart", job=job))
+
+    assert saved_steps[0] == "Starting"
+    assert set(saved_steps[1:7]) == set(app_module.analysis_pipeline.steps)
+    assert saved_steps[7:] == ["Responding"]
+    assert app_module.job_checkpoints.load_all() == []
+    assert sessions["ckpt-steps"]["status"] == "completed"
+
+
+def test_interrupted_job_resumes_after_restart(clock):
+    app_module.query_cache.invalidate()
+    job = new_job("ckpt-resume")
+
+    async def interrupted_run():
+        task = asyncio.create_task(process_query_with_progress("ckpt-resume", job["user_query"], "chart", job=job))
+        await asyncio.sleep(1.2)  # "Scanning databases" and "Analyzing" are done
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    clock.run(interrupted_run())
+    [checkpoint] = app_module.job_checkpoints.load_all()
+    assert set(checkpoint["results"]) == {"Scanning databases", "Analyzing"}
+
+    # A new process has no sessions and a fresh logger
+    sessions.delete("ckpt-resume")
+    app_module.progress_logger = ProgressLogger(logs_dir=None, clock=clock)
+
+    async def restart():
+        result = await resume_interrupted_jobs()
+        await asyncio.gather(*app_module.job_scheduler._tasks)
+        return result
+
+    started = clock.time()
+    assert clock.run(restart()) == {"resumed": 1, "failed": 0}
+    assert clock.time() - started == pytest.approx(1.5)
+
+    session = sessions["ckpt-resume"]
+    assert session["status"] == "completed"
+    assert [message["type"] for message in session["messages"]] == ["user", "assistant"]
+    logs = app_module.progress_logger.get_progress_logs("ckpt-resume")
+    assert logs[0]["resumed"] is True
+    assert "Analyzing" not in [log["step"] for log in logs]
+    assert logs[-1]["step"] == "Finished"
+    assert app_module.job_checkpoints.load_all() == []
+
+
+def test_job_interrupted_after_answering_stores_the_answer_again(clock):
+    app_module.query_cache.invalidate()
+    job = new_job("ckpt-answered")
+    job.update(step="Answered", result={"content": "Answer from before the restart"})
+    app_module.job_checkpoints.save(job)
+    sessions.delete("ckpt-answered")
+
+    async def restart():
+        result = await resume_interrupted_jobs()
+        await asyncio.gather(*app_module.job_scheduler._tasks)
+        return result
+
+    assert clock.run(restart()) == {"resumed": 1, "failed": 0}
+
+    session = sessions["ckpt-answered"]
+    assert session["status"] == "completed"
+    assert [message["type"] for message in session["messages"]] == ["user", "assistant"]
+    assert app_module.resolve_message(session["messages"][-1])["content"] == "Answer from before the restart"
+    assert [log["step"] for log in app_module.progress_logger.get_progress_logs("ckpt-answered")] == \
+        ["Starting", "Completed", "Finished"]
+    assert app_module.job_checkpoints.load_all() == []
+
+
+def test_stale_checkpoint_fails_cleanly(clock):
+    new_job("ckpt-stale", created_at=(datetime.now() - timedelta(hours=2)).isoformat())
+    sessions.delete("ckpt-stale")
+
+    assert clock.run(resume_interrupted_jobs(max_age=3600)) == {"resumed": 0, "failed": 1}
+    assert sessions["ckpt-stale"]["status"] == "error"
+    assert app_module.progress_logger.get_progress_logs("ckpt-stale")[-1]["step"] == "Error"
+    assert app_module.job_checkpoints.load_all() == []
+
+
+def test_every_interrupted_job_restores_its_message_in_order(clock):
+    first_at = datetime.now() - timedelta(hours=2)
+    first = new_job("ckpt-pair", query="First question", created_at=first_at.isoformat())
+    app_module.job_checkpoints.remove(first["job_id"])
+    first["job_id"] = "job-ckpt-pair-1"
+    app_module.job_checkpoints.save(first)
+    new_job("ckpt-pair", query="Second question", created_at=(first_at + timedelta(minutes=1)).isoformat())
+    sessions.delete("ckpt-pair")
+
+    assert clock.run(resume_interrupted_jobs(max_age=3600)) == {"resumed": 0, "failed": 2}
+    questions = [message["content"] for message in sessions["ckpt-pair"]["messages"] if message["type"] == "user"]
+    assert questions == ["First question", "Second question"]
+
+
+def test_shutdown_drains_then_cancels_after_deadline():
+    clock = VirtualClock()
+    scheduler = FairJobScheduler(max_concurrent_jobs=2, max_jobs_per_user=10, max_sessions_per_user=10)
+    finished = []
+
+    def job(name, seconds):
+        async def run():
+            await asyncio.sleep(seconds)
+            finished.append(name)
+        return run
+
+    async def scenario():
+        scheduler.submit("u", "s1", job("quick", 0.5))
+        scheduler.submit("u", "s2", job("slow", 10))
+        scheduler.submit("u", "s3", job("queued", 0.1))
+        return await scheduler.shutdown(timeout=1)
+
+    assert clock.run(scenario()) == {"drained": 1, "cancelled": 1, "dropped": 1}
+    assert finished == ["quick"]
+    assert clock.time() == 1
+    with pytest.raises(SchedulerLimitError) as exc:
+        scheduler.check_limits("u", "s4")
+    assert exc.value.reason == "shutting_down"
+    # Dropped jobs don't count against the user once the scheduler restarts
+    assert scheduler.stats()["running"] == 0
+    scheduler.start()
+    scheduler.max_jobs_per_user = 1
+    scheduler.check_limits("u", "s4")
+
+
+def test_query_refused_while_shutting_down(monkeypatch):
+    monkeypatch.setattr(app_module, "rate_limiter", TokenBucketRateLimiter(rate=100, burst=100))
+    with TestClient(app) as client:
+        app_module.job_scheduler.accepting = False
+        response = client.post("/api/query", json={"user_query": "hi", "user_email": "dana@example.com"})
+        assert response.status_code == 503
+        assert response.json()["detail"]["error"] == "shutting_down"
@@ -0,0 +1,186 @@
+import asyncio
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import (
+    AnalysisPipeline,
+    FairJobScheduler,
+    ProgressLogger,
+    StepDelayProfile,
+    TokenBucketRateLimiter,
+    VirtualClock,
+    app,
+    job_lane_for,
+    simulate_analysis_with_progress,
+)
+
+
+def new_scheduler(**kwargs):
+    return FairJobScheduler(max_jobs_per_user=10, max_sessions_per_user=10, **kwargs)
+
+
+def linear_pipeline(steps=4):
+    pipeline = AnalysisPipeline()
+    for i in range(steps):
+        pipeline.add_step(f"Step {i}", "...", depends_on=[f"Step {i - 1}"] if i else None)
+    return pipeline
+
+
+def test_response_types_map_to_lanes():
+    assert job_lane_for("file") == "bulk"
+    assert [job_lane_for(t) for t in ("chart", "text", "progress")] == ["interactive"] * 3
+
+
+def test_interactive_jobs_start_ahead_of_queued_bulk_jobs():
+    clock = VirtualClock()
+    scheduler = new_scheduler(max_concurrent_jobs=1)
+    started = []
+
+    def job(name):
+        async def run():
+            started.append((name, clock.time()))
+            await asyncio.sleep(1)
+        return run
+
+    async def main():
+        scheduler.submit("a", "export-1", job("export-1"), lane="bulk")
+        scheduler.submit("a", "export-2", job("export-2"), lane="bulk")
+        scheduler.submit("b", "chart-1", job("chart-1"))
+        while scheduler.stats()["running"] or scheduler.stats()["queued"]:
+            await asyncio.sleep(0.1)
+
+    clock.run(main())
+
+    assert [name for name, _ in started] == ["export-1", "chart-1", "export-2"]
+    assert [at for _, at in started] == pytest.approx([0, 1, 2])
+
+
+def test_each_lane_has_its_own_concurrency_limit():
+    scheduler = new_scheduler(max_concurrent_jobs=4, max_bulk_jobs=1)
+
+    async def main():
+        for i in range(3):
+            scheduler.submit("a", f"export-{i}", lambda: asyncio.sleep(1), lane="bulk")
+        for i in range(2):
+            scheduler.submit("b", f"chart-{i}", lambda: asyncio.sleep(1))
+        lanes = scheduler.stats()["lanes"]
+        await scheduler.shutdown(timeout=0)
+        return lanes
+
+    lanes = asyncio.run(main())
+    assert lanes["bulk"] == {"running": 1, "queued": 2, "max_jobs": 1}
+    assert lanes["interactive"] == {"running": 2, "queued": 0, "max_jobs": 4}
+
+
+def test_bulk_jobs_keep_a_reserved_share_under_interactive_load():
+    clock = VirtualClock()
+    scheduler = new_scheduler(max_concurrent_jobs=2, min_bulk_jobs=1)
+    started = {}
+
+    def job(name):
+        async def run():
+            started[name] = clock.time()
+            await asyncio.sleep(1)
+        return run
+
+    async def main():
+        for i in range(2):
+            scheduler.submit("b", f"chart-{i}", job(f"chart-{i}"))
+        scheduler.submit("a", "export", job("export"), lane="bulk")
+        for i in range(2, 8):
+            scheduler.submit("b", f"chart-{i}", job(f"chart-{i}"))
+        while scheduler.stats()["running"] or scheduler.stats()["queued"]:
+            await asyncio.sleep(0.1)
+
+    clock.run(main())
+
+    # The first freed slot goes to the export instead of the six queued charts
+    assert started["export"] == pytest.approx(1)
+    assert max(started.values()) == pytest.approx(4)
+
+
+def run_mixed_load(bulk_yields):
+    """A 2s bulk export holds the only slot when a 1s interactive job arrives at t=0.2"""
+    clock = VirtualClock()
+    scheduler = new_scheduler(max_concurrent_jobs=1, bulk_yields=bulk_yields)
+    logger = ProgressLogger(logs_dir=None, clock=clock)
+    finished = {}
+
+    async def export():
+        await simulate_analysis_with_progress("export", "q", "file", logger=logger,
+                                              delays=StepDelayProfile(default=0.5), pipeline=linear_pipeline(),
+                                              yield_point=scheduler.yield_point)
+        finished["export"] = clock.time()
+
+    async def chart():
+        await asyncio.sleep(1)
+        finished["chart"] = clock.time()
+
+    async def main():
+        scheduler.submit("a", "export", export, lane="bulk")
+        await asyncio.sleep(0.2)
+        scheduler.submit("b", "chart", chart)
+        while scheduler.stats()["running"] or scheduler.stats()["queued"] or scheduler.stats()["paused_bulk_jobs"]:
+            await asyncio.sleep(0.1)
+
+    clock.run(main())
+    return finished, scheduler.stats()
+
+
+def test_bulk_job_yields_to_interactive_job_at_step_boundary():
+    finished, stats = run_mixed_load(bulk_yields=True)
+
+    # The export gives up its slot when its second step is due (t=0.5)
+    assert finished["chart"] == pytest.approx(1.5)
+    assert finished["export"] == pytest.approx(3.0)
+    assert stats["bulk_yields"] == 1
+    assert stats["running"] == 0
+
+
+def test_bulk_job_keeps_its_slot_when_yielding_is_off():
+    finished, stats = run_mixed_load(bulk_yields=False)
+
+    assert finished["export"] == pytest.approx(2.0)
+    assert finished["chart"] == pytest.approx(3.0)
+    assert stats["bulk_yields"] == 0
+
+
+def test_shutdown_cancels_paused_bulk_jobs_cleanly():
+    clock = VirtualClock()
+    scheduler = new_scheduler(max_concurrent_jobs=1)
+    logger = ProgressLogger(logs_dir=None, clock=clock)
+
+    async def export():
+        await simulate_analysis_with_progress("export", "q", "file", logger=logger, pipeline=linear_pipeline(),
+                                              yield_point=scheduler.yield_point)
+
+    async def main():
+        scheduler.submit("a", "export", export, lane="bulk")
+        await asyncio.sleep(0.2)
+        scheduler.submit("b", "chart", lambda: asyncio.sleep(10))
+        await asyncio.sleep(1)
+        assert scheduler.stats()["paused_bulk_jobs"] == 1
+        return await scheduler.shutdown(timeout=1)
+
+    assert clock.run(main()) == {"drained": 0, "cancelled": 2, "dropped": 0}
+    stats = scheduler.stats()
+    assert stats["running"] == 0 and stats["paused_bulk_jobs"] == 0
+
+
+def test_file_exports_are_queued_in_the_bulk_lane(monkeypatch):
+    monkeypatch.setattr(app_module, "rate_limiter", TokenBucketRateLimiter(rate=100, burst=100))
+    monkeypatch.setattr(app_module, "job_scheduler", new_scheduler(max_concurrent_jobs=0))
+    with TestClient(app) as client:
+        for query in ("Export this to an Excel spreadsheet", "Show me a bar chart"):
+            assert client.post("/api/query", json={"user_query": query, "user_email": "lanes@example.com",
+                                                   "session_id": "lanes-1"}).status_code == 200
+
+        lanes = client.get("/api/stats/scheduler").json()["lanes"]
+        assert lanes["bulk"]["queued"] == 1
+        assert lanes["interactive"]["queued"] == 1
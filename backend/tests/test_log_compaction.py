@@ -0,0 +1,133 @@
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import LogSegmentStore, ProgressLogger
+
+
+def finish_session(logger, session_id, extra_steps=("Analyzing",)):
+    async def run():
+        await logger.log_progress(session_id, "Starting", "Starting", 1, 3)
+        for step in extra_steps:
+            await logger.log_progress(session_id, step, step, 2, 3)
+        await logger.log_progress(session_id, "Finished", "Done", 3, 3)
+    asyncio.run(run())
+
+
+def test_finished_logs_are_packed_and_still_readable(tmp_path):
+    logger = ProgressLogger(logs_dir=str(tmp_path))
+    for i in range(5):
+        finish_session(logger, f"s{i}")
+    asyncio.run(logger.log_progress("running", "Starting", "Starting", 1, 3))
+    expected = {f"s{i}": list(logger.get_progress_logs(f"s{i}")) for i in range(5)}
+
+    result = logger.compact(min_age=0)
+
+    assert result["compacted"] == 5
+    # Only the unfinished session keeps a live file
+    assert sorted(n for n in os.listdir(tmp_path) if n.endswith(".json")) == ["running_progress.json"]
+    for session_id, logs in expected.items():
+        assert logger.get_progress_logs(session_id) == logs
+
+    # A fresh process finds compacted sessions through the rebuilt index
+    reopened = ProgressLogger(logs_dir=str(tmp_path))
+    assert reopened.get_progress_logs("s3") == expected["s3"]
+    assert reopened.segments.stats()["sessions"] == 5
+
+
+def test_recent_logs_wait_for_min_age(tmp_path):
+    logger = ProgressLogger(logs_dir=str(tmp_path))
+    finish_session(logger, "fresh")
+
+    assert logger.compact(min_age=3600)["compacted"] == 0
+    assert os.path.exists(os.path.join(str(tmp_path), "fresh_progress.json"))
+
+
+def test_follow_up_query_moves_session_back_to_live_file(tmp_path):
+    logger = ProgressLogger(logs_dir=str(tmp_path))
+    finish_session(logger, "again")
+    logger.compact(min_age=0)
+
+    reopened = ProgressLogger(logs_dir=str(tmp_path))
+    finish_session(reopened, "again")
+
+    logs = reopened.get_progress_logs("again")
+    assert [entry["step"] for entry in logs] == ["Starting", "Analyzing", "Finished"] * 2
+    assert "again" not in reopened.segments
+    assert ProgressLogger(logs_dir=str(tmp_path)).get_progress_logs("again") == logs
+
+
+def test_delete_logs_removes_live_and_compacted_copies(tmp_path):
+    logger = ProgressLogger(logs_dir=str(tmp_path))
+    finish_session(logger, "packed")
+    logger.compact(min_age=0)
+    finish_session(logger, "live")
+
+    logger.delete_logs("packed")
+    logger.delete_logs("live")
+
+    assert logger.get_progress_logs("packed") == []
+    assert logger.get_progress_logs("live") == []
+    # Tombstones survive a restart
+    assert ProgressLogger(logs_dir=str(tmp_path)).get_progress_logs("packed") == []
+
+
+def test_tombstone_survives_restart_when_last_segment_is_full(tmp_path):
+    store = LogSegmentStore(str(tmp_path), max_segment_bytes=10)
+    store.append([("a", [{"step": "Finished"}])])
+
+    store.remove("a")
+
+    assert "a" not in LogSegmentStore(str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == ["segment-000001.idx", "segment-000001.jsonl"]
+    assert store.enforce_retention(max_age=3600, max_total_bytes=10 ** 9) == 0
+
+
+def test_retention_drops_oldest_segments_by_size(tmp_path):
+    store = LogSegmentStore(str(tmp_path), max_segment_bytes=1)
+    for i in range(4):
+        store.append([(f"s{i}", [{"step": "Finished", "message": "x" * 100}])])
+    newest_two = sum(os.path.getsize(os.path.join(str(tmp_path), f"segment-00000{i}.{ext}"))
+                     for i in (3, 4) for ext in ("jsonl", "idx"))
+
+    dropped = store.enforce_retention(max_age=3600, max_total_bytes=newest_two)
+
+    assert dropped == 2
+    assert "s0" not in store and "s1" not in store
+    assert store.read("s3")[0]["step"] == "Finished"
+
+
+def test_retention_drops_expired_segments(tmp_path, monkeypatch):
+    store = LogSegmentStore(str(tmp_path), max_segment_bytes=1)
+    now = time.time()
+    monkeypatch.setattr(app_module.time, "time", lambda: now - 7200)
+    store.append([("old", [{"step": "Finished"}])])
+    monkeypatch.setattr(app_module.time, "time", lambda: now)
+    store.append([("new", [{"step": "Finished"}])])
+
+    assert store.enforce_retention(max_age=3600, max_total_bytes=10 ** 9) == 1
+    assert store.read("old") is None
+    assert store.read("new") == [{"step": "Finished"}]
+
+
+def test_active_segment_rolls_over_by_age_and_expires(tmp_path, monkeypatch):
+    clock = {"now": 1_000_000.0}
+    monkeypatch.setattr(app_module.time, "time", lambda: clock["now"])
+    store = LogSegmentStore(str(tmp_path), max_segment_age=86400)
+    store.append([("day1", [{"step": "Finished"}])])
+    clock["now"] += 3600
+    store.append([("day1-later", [{"step": "Finished"}])])
+    clock["now"] += 86400
+    store.append([("day2", [{"step": "Finished"}])])
+
+    assert store.stats()["segments"] == 2
+    # A restarted store still knows when each segment was written
+    clock["now"] += 3 * 86400
+    restarted = LogSegmentStore(str(tmp_path), max_segment_age=86400)
+    assert restarted.enforce_retention(max_age=3 * 86400, max_total_bytes=10 ** 9) == 1
+    assert restarted.read("day1") is None
+    assert restarted.read("day2") == [{"step": "Finished"}]
@@ -0,0 +1,133 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import (
+    AnalysisPipeline,
+    ProgressLogger,
+    StepDelayProfile,
+    VirtualClock,
+    analysis_pipeline,
+    default_step_delays,
+    simulate_analysis_with_progress,
+)
+
+
+def build_fan_out_pipeline():
+    pipeline = AnalysisPipeline()
+    pipeline.add_step("Scan A", "Scanning source A...")
+    pipeline.add_step("Scan B", "Scanning source B...")
+    pipeline.add_step("Scan C", "Scanning source C...")
+    pipeline.add_step("Merge", "Merging sources...", depends_on=["Scan A", "Scan B", "Scan C"])
+    return pipeline
+
+
+def test_independent_steps_run_concurrently():
+    clock = VirtualClock()
+    logger = ProgressLogger(logs_dir=None, clock=clock)
+    delays = StepDelayProfile(default=1.0, overrides={"Scan B": 3.0})
+    pipeline = build_fan_out_pipeline()
+
+    clock.run(simulate_analysis_with_progress("fan-out", "q", "chart", logger=logger,
+                                              delays=delays, pipeline=pipeline))
+
+    # Critical path is Scan B (3s) + Merge (1s), not the 6s sum of all steps
+    assert clock.time() == 4.0
+    assert pipeline.critical_path(delays) == 4.0
+
+    logs = logger.get_progress_logs("fan-out")
+    assert [(log["step"], log["step_number"]) for log in logs] == [
+        ("Scan A", 1), ("Scan B", 2), ("Scan C", 3), ("Merge", 4), ("Completed", 4)
+    ]
+    # All three scans start together, the merge waits for the slowest one
+    assert len({log["timestamp"] for log in logs[:3]}) == 1
+    assert logs[3]["timestamp"] == (clock.start.replace(second=3)).isoformat()
+
+
+def test_default_pipeline_keeps_step_order():
+    clock = VirtualClock()
+    logger = ProgressLogger(logs_dir=None, clock=clock)
+
+    clock.run(simulate_analysis_with_progress("default", "q", "chart", logger=logger))
+
+    assert [log["step"] for log in logger.get_progress_logs("default")] == [
+        "Scanning databases", "Analyzing", "Fetching relevant data", "Writing code",
+        "Executing code", "Preparing response", "Completed"
+    ]
+    assert analysis_pipeline.critical_path(default_step_delays) == clock.time()
+
+
+def test_handler_results_are_collected():
+    pipeline = AnalysisPipeline()
+
+    @pipeline.step("Load", "Loading...")
+    async def load(ctx):
+        return [1, 2, 3]
+
+    @pipeline.step("Sum", "Summing...", depends_on=["Load"])
+    async def total(ctx):
+        return sum(ctx.results["Load"])
+
+    clock = VirtualClock()
+    logger = ProgressLogger(logs_dir=None, clock=clock)
+    results = clock.run(simulate_analysis_with_progress("results", "q", "text",
+                                                        logger=logger, pipeline=pipeline))
+
+    assert results == {"Load": [1, 2, 3], "Sum": 6}
+
+
+def test_failing_step_cancels_siblings():
+    pipeline = AnalysisPipeline()
+    cancelled = []
+
+    @pipeline.step("Slow", "Slow step...")
+    async def slow(ctx):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append("Slow")
+            raise
+
+    @pipeline.step("Broken", "Broken step...")
+    async def broken(ctx):
+        raise RuntimeError("boom")
+
+    clock = VirtualClock()
+    logger = ProgressLogger(logs_dir=None, clock=clock)
+    with pytest.raises(RuntimeError, match="boom"):
+        clock.run(simulate_analysis_with_progress("broken", "q", "text", logger=logger, pipeline=pipeline))
+
+    assert cancelled == ["Slow"]
+    assert clock.time() == 0.0
+
+
+def test_tasks_are_only_spawned_for_overlapping_steps():
+    clock = VirtualClock()
+    logger = ProgressLogger(logs_dir=None, clock=clock)
+    spawned = []
+
+    def counting_factory(loop, coro, **kwargs):
+        spawned.append(coro)
+        return asyncio.Task(coro, loop=loop, **kwargs)
+
+    async def run():
+        asyncio.get_running_loop().set_task_factory(counting_factory)
+        await simulate_analysis_with_progress("tasks", "q", "chart", logger=logger)
+
+    clock.run(run())
+
+    # Only "Fetching relevant data" and "Writing code" run side by side
+    assert len(spawned) == 2
+
+
+def test_dependencies_must_be_registered_first():
+    pipeline = AnalysisPipeline()
+    with pytest.raises(ValueError):
+        pipeline.add_step("Merge", "Merging...", depends_on=["Scan"])
+    pipeline.add_step("Scan", "Scanning...")
+    with pytest.raises(ValueError):
+        pipeline.add_step("Scan", "Scanning again...")
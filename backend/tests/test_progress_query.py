@@ -0,0 +1,107 @@
+import os
+import sys
+from datetime import timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import (
+    DurationStats,
+    ProgressIndex,
+    ProgressLogger,
+    VirtualClock,
+    app,
+    progress_logger,
+    simulate_analysis_with_progress,
+)
+
+
+def run_session(logger, clock, session_id, terminal="Finished"):
+    async def run():
+        await logger.log_progress(session_id, "Starting", "Starting", 0, 6)
+        await simulate_analysis_with_progress(session_id, "q", "chart", logger=logger)
+        await logger.log_progress(session_id, terminal, terminal, 6, 6)
+    clock.run(run())
+
+
+def test_step_durations_are_aggregated_as_steps_run():
+    clock = VirtualClock()
+    logger = ProgressLogger(logs_dir=None, clock=clock)
+    for i in range(3):
+        run_session(logger, clock, f"timed-{i}")
+
+    durations = logger.index.duration_summary()
+    executing = durations["steps"]["Executing code"]
+    assert executing["count"] == 3
+    assert executing["p95"] == pytest.approx(0.5)
+    assert durations["end_to_end"]["count"] == 3
+    assert durations["end_to_end"]["mean"] == pytest.approx(2.5)
+
+
+def test_percentiles_stay_within_bucket_error():
+    stats = DurationStats()
+    for ms in range(1, 1001):
+        stats.add(ms / 1000)
+
+    assert stats.count == 1000
+    assert stats.min == 0.001 and stats.max == 1.0
+    assert stats.percentile(50) == pytest.approx(0.5, rel=0.05)
+    assert stats.percentile(95) == pytest.approx(0.95, rel=0.05)
+
+
+def test_query_filters_by_status_step_session_and_time():
+    clock = VirtualClock()
+    logger = ProgressLogger(logs_dir=None, clock=clock)
+    run_session(logger, clock, "ok-1")
+    clock.advance(3600)
+    run_session(logger, clock, "bad-1", terminal="Error")
+    run_session(logger, clock, "ok-2")
+
+    errors, truncated = logger.index.query(status="error")
+    assert [e["session_id"] for e in errors] == ["bad-1"] and not truncated
+
+    recent, _ = logger.index.query(step="Executing code", since=clock.now() - timedelta(minutes=30))
+    assert [e["session_id"] for e in recent] == ["ok-2", "bad-1"]
+
+    session, _ = logger.index.query(session_id="ok-1", limit=2)
+    assert [e["step"] for e in session] == ["Finished", "Completed"]
+    _, truncated = logger.index.query(session_id="ok-1", limit=2)
+    assert truncated
+
+
+def test_oldest_entries_are_evicted_and_sessions_can_be_removed():
+    clock = VirtualClock()
+    logger = ProgressLogger(logs_dir=None, clock=clock)
+    logger.index = ProgressIndex(max_entries=9)
+    run_session(logger, clock, "first")
+    run_session(logger, clock, "second")
+
+    assert logger.index.query(session_id="first") == ([], False)
+    # Each session logs 9 entries; only the second one's fit
+    assert len(logger.index.query(limit=100)[0]) == 9
+
+    logger.index.remove_session("second")
+    assert logger.index.query(step="Finished") == ([], False)
+    # Aggregates outlive the entries they were computed from
+    assert logger.index.duration_summary("Analyzing")["steps"]["Analyzing"]["count"] == 2
+
+
+def test_query_endpoint():
+    with TestClient(app) as client:
+        progress_logger.delete_logs("query-err")
+        client.portal.call(progress_logger.log_progress, "query-err", "Starting", "Starting", 0, 6)
+        client.portal.call(progress_logger.log_progress, "query-err", "Error", "Boom", 6, 6)
+
+        response = client.get("/api/progress", params={"status": "error", "session_id": "query-err"})
+        assert response.status_code == 200
+        body = response.json()
+        assert body["sessions"] == ["query-err"]
+        assert [e["message"] for e in body["entries"]] == ["Boom"]
+        assert "end_to_end" in body["durations"]
+
+        assert client.get("/api/progress", params={"status": "stuck"}).status_code == 400
+        assert client.get("/api/progress", params={"limit": 0}).status_code == 422
+        # Per-session route still resolves
+        assert client.get("/api/progress/query-err").json()["logs"][-1]["step"] == "Error"
@@ -0,0 +1,96 @@
+import os
+import sys
+
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import (
+    QueryResultCache,
+    VirtualClock,
+    app,
+    process_query_with_progress,
+    progress_logger,
+    query_cache,
+    resolve_message,
+    sessions,
+)
+
+
+def new_session(session_id):
+    progress_logger.delete_logs(session_id)
+    sessions.create(session_id, title="t", created_at="", last_activity="", status="processing")
+
+
+def test_normalization_ignores_case_whitespace_and_punctuation():
+    cache = QueryResultCache()
+    assert cache.normalize_query("  Show me a Revenue   chart, by region!! ") == "show me a revenue chart by region"
+    assert cache.make_key("Show me a PIE chart", "chart") == cache.make_key("show me a pie chart?", "chart")
+    assert cache.make_key("show me a pie chart", "chart") != cache.make_key("show me a bar chart", "chart")
+
+
+def test_ttl_expiry_and_lru_eviction():
+    clock = VirtualClock()
+    cache = QueryResultCache(max_entries=2, ttl=10, clock=clock)
+    cache.put(("a",), {"content": "A"})
+    cache.put(("b",), {"content": "B"})
+    assert cache.get(("a",)) == {"content": "A"}
+
+    cache.put(("c",), {"content": "C"})  # evicts "b", the least recently used
+    assert cache.get(("b",)) is None
+    assert cache.get(("c",)) == {"content": "C"}
+
+    clock.advance(10)
+    assert cache.get(("a",)) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["expirations"]) == (2, 2, 1, 1)
+
+
+def test_repeated_query_is_served_from_cache():
+    query_cache.invalidate()
+    clock = VirtualClock()
+    new_session("cache-first")
+    new_session("cache-second")
+
+    clock.run(process_query_with_progress("cache-first", "Show me a pie chart", "chart"))
+    first_run = clock.time()
+    clock.run(process_query_with_progress("cache-second", "  show me a PIE chart. ", "chart"))
+
+    assert clock.time() == first_run  # the cache hit took no pipeline time
+    trace = progress_logger.get_progress_logs("cache-second")
+    assert [entry["step"] for entry in trace] == ["Starting", "Completed", "Finished"]
+    assert all(entry["cached"] for entry in trace)
+    assert "cached" not in progress_logger.get_progress_logs("cache-first")[0]
+
+    first = resolve_message(sessions["cache-first"]["messages"][-1])
+    second = resolve_message(sessions["cache-second"]["messages"][-1])
+    assert first["chart_data"] == second["chart_data"]
+    assert sessions["cache-second"]["status"] == "completed"
+
+
+def test_file_exports_are_not_shared():
+    query_cache.invalidate()
+    clock = VirtualClock()
+    new_session("export-first")
+    new_session("export-second")
+
+    for session_id in ("export-first", "export-second"):
+        clock.run(process_query_with_progress(session_id, "Export sales data to Excel", "file"))
+
+    first = resolve_message(sessions["export-first"]["messages"][-1])
+    second = resolve_message(sessions["export-second"]["messages"][-1])
+    assert first["file_info"]["download_url"] != second["file_info"]["download_url"]
+    assert query_cache.stats()["entries"] == 0
+
+
+def test_cache_endpoints():
+    query_cache.invalidate()
+    key = query_cache.make_key("Export sales data to Excel", "file")
+    query_cache.put(key, {"content": "report"})
+    query_cache.put(query_cache.make_key("Analyze customer insights", "text"), {"content": "text"})
+
+    with TestClient(app) as client:
+        assert client.get("/api/cache/stats").json()["entries"] == 2
+        response = client.delete("/api/cache", params={"user_query": "export sales data to excel!"})
+        assert response.json()["invalidated"] == 1
+        assert client.delete("/api/cache").json()["invalidated"] == 1
@@ -0,0 +1,92 @@
+import asyncio
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import (
+    FairJobScheduler,
+    SchedulerLimitError,
+    TokenBucketRateLimiter,
+    VirtualClock,
+    app,
+)
+
+
+def test_token_bucket_refills_over_time():
+    clock = VirtualClock()
+    limiter = TokenBucketRateLimiter(rate=1.0, burst=2, clock=clock)
+
+    assert limiter.try_acquire("a") == 0
+    assert limiter.try_acquire("a") == 0
+    assert limiter.try_acquire("a") == pytest.approx(1.0)
+    assert limiter.try_acquire("b") == 0  # buckets are per user
+
+    clock.advance(0.5)
+    assert limiter.try_acquire("a") == pytest.approx(0.5)
+    clock.advance(0.5)
+    assert limiter.try_acquire("a") == 0
+
+
+def test_jobs_are_round_robin_across_users():
+    clock = VirtualClock()
+    scheduler = FairJobScheduler(max_concurrent_jobs=1, max_jobs_per_user=10, max_sessions_per_user=10)
+    started = []
+
+    def job(name):
+        async def run():
+            started.append(name)
+            await asyncio.sleep(1)
+        return run
+
+    async def main():
+        for i in range(1, 4):
+            scheduler.submit("heavy", f"heavy-{i}", job(f"heavy-{i}"))
+        for i in range(1, 3):
+            scheduler.submit("light", f"light-{i}", job(f"light-{i}"))
+        while scheduler.stats()["running"] or scheduler.stats()["queued"]:
+            await asyncio.sleep(0.1)
+
+    clock.run(main())
+
+    assert started == ["heavy-1", "heavy-2", "light-1", "heavy-3", "light-2"]
+
+
+def test_per_user_job_and_session_limits():
+    scheduler = FairJobScheduler(max_concurrent_jobs=0, max_jobs_per_user=3, max_sessions_per_user=2)
+
+    async def main():
+        scheduler.submit("user", "s1", asyncio.sleep)
+        scheduler.submit("user", "s2", asyncio.sleep)
+        with pytest.raises(SchedulerLimitError) as error:
+            scheduler.submit("user", "s3", asyncio.sleep)
+        assert error.value.reason == "too_many_sessions"
+        scheduler.submit("user", "s1", asyncio.sleep)
+        with pytest.raises(SchedulerLimitError) as error:
+            scheduler.submit("user", "s1", asyncio.sleep)
+        assert error.value.reason == "too_many_jobs"
+        scheduler.submit("other", "s4", asyncio.sleep)
+
+    asyncio.run(main())
+
+
+def test_query_endpoint_returns_structured_429(monkeypatch):
+    monkeypatch.setattr(app_module, "rate_limiter", TokenBucketRateLimiter(rate=0.01, burst=2))
+    monkeypatch.setattr(app_module, "job_scheduler", FairJobScheduler(max_concurrent_jobs=0))
+    payload = {"user_query": "Show me a revenue chart", "user_email": "Flood@Example.com"}
+
+    with TestClient(app) as client:
+        assert client.post("/api/query", json={**payload, "session_id": "rl-1"}).status_code == 200
+        assert client.post("/api/query", json={**payload, "session_id": "rl-1"}).status_code == 200
+
+        response = client.post("/api/query", json={**payload, "session_id": "rl-1"})
+        assert response.status_code == 429
+        assert response.json()["detail"]["error"] == "rate_limited"
+        assert int(response.headers["retry-after"]) >= 1
+
+        other = {"user_query": "Show me a revenue chart", "user_email": "someone@example.com"}
+        assert client.post("/api/query", json=other).status_code == 200
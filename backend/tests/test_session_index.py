@@ -0,0 +1,52 @@
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import FairJobScheduler, TokenBucketRateLimiter, app, sessions
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # Keep jobs queued so the test only exercises session bookkeeping
+    monkeypatch.setattr(app_module, "job_scheduler",
+                        FairJobScheduler(max_concurrent_jobs=0, max_jobs_per_user=100, max_sessions_per_user=100))
+    monkeypatch.setattr(app_module, "rate_limiter", TokenBucketRateLimiter(rate=100, burst=100))
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def ask(client, email, session_id):
+    response = client.post("/api/query", json={"user_query": "Analyze revenue", "user_email": email,
+                                               "session_id": session_id})
+    assert response.status_code == 200
+
+
+def test_listing_is_scoped_to_owner_and_ordered_by_activity(client):
+    ask(client, "alice@example.com", "index-a1")
+    ask(client, "alice@example.com", "index-a2")
+    ask(client, "bob@example.com", "index-b1")
+
+    listed = client.get("/api/sessions", params={"user_email": "Alice@Example.com "}).json()
+    assert [s["session_id"] for s in listed] == ["index-a2", "index-a1"]
+
+    # New activity moves a session to the top of its owner's list
+    ask(client, "alice@example.com", "index-a1")
+    listed = client.get("/api/sessions", params={"user_email": "alice@example.com"}).json()
+    assert [s["session_id"] for s in listed] == ["index-a1", "index-a2"]
+
+    assert [s["session_id"] for s in client.get("/api/sessions", params={"user_email": "bob@example.com"}).json()] \
+        == ["index-b1"]
+    assert client.get("/api/sessions", params={"user_email": "nobody@example.com"}).json() == []
+
+
+def test_delete_removes_session_from_index(client):
+    ask(client, "carol@example.com", "index-c1")
+    client.delete("/api/sessions/index-c1")
+
+    assert sessions.sessions_for_user("carol@example.com") == []
+    assert client.get("/api/sessions", params={"user_email": "carol@example.com"}).json() == []
@@ -0,0 +1,69 @@
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, append_message, generate_chart_data, resolve_message, sessions
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def long_session():
+    session_id = "pagination-test"
+    sessions.create(session_id, title="Pagination test", created_at="2024-01-01T00:00:00",
+                    last_activity="2024-01-01T00:00:00", status="completed")
+    for i in range(5):
+        append_message(session_id, {"type": "user", "content": f"question {i}", "timestamp": "2024-01-01T00:00:00"})
+        append_message(session_id, {"type": "assistant", "content": f"answer {i}",
+                                    "chart_data": generate_chart_data("bar"), "timestamp": "2024-01-01T00:00:00"})
+    yield session_id
+    sessions.delete(session_id)
+
+
+def test_without_limit_returns_full_history(client, long_session):
+    data = client.get(f"/api/sessions/{long_session}").json()
+
+    assert len(data["messages"]) == 10
+    assert data["messages"][1]["chart_data"]["type"] == "bar"
+    assert "next_cursor" not in data
+
+
+def test_pages_walk_backwards_from_newest(client, long_session):
+    first = client.get(f"/api/sessions/{long_session}", params={"limit": 4}).json()
+    assert [m["content"] for m in first["messages"]] == ["question 3", "answer 3", "question 4", "answer 4"]
+    assert first["has_more"] and first["total_messages"] == 10
+
+    second = client.get(f"/api/sessions/{long_session}",
+                        params={"limit": 4, "cursor": first["next_cursor"]}).json()
+    assert [m["content"] for m in second["messages"]] == ["question 1", "answer 1", "question 2", "answer 2"]
+
+    last = client.get(f"/api/sessions/{long_session}",
+                      params={"limit": 4, "cursor": second["next_cursor"]}).json()
+    assert [m["content"] for m in last["messages"]] == ["question 0", "answer 0"]
+    assert last["has_more"] is False and last["next_cursor"] is None
+
+
+def test_attachments_as_references(client, long_session):
+    data = client.get(f"/api/sessions/{long_session}", params={"limit": 2, "attachments": "ref"}).json()
+    answer = data["messages"][-1]
+
+    assert "chart_data" not in answer
+    chart = client.get(answer["attachments"]["chart_data"]).json()
+    assert chart == resolve_message(sessions[long_session]["messages"][-1])["chart_data"]
+
+
+def test_invalid_cursor_and_missing_attachment(client, long_session):
+    assert client.get(f"/api/sessions/{long_session}", params={"cursor": "abc"}).status_code == 400
+    assert client.get(f"/api/sessions/{long_session}", params={"cursor": "99"}).status_code == 400
+
+    question_id = sessions[long_session]["messages"][0]["message_id"]
+    url = f"/api/sessions/{long_session}/messages/{question_id}/attachments/chart_data"
+    assert client.get(url).status_code == 404
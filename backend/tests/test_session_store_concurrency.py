@@ -0,0 +1,108 @@
+import asyncio
+import os
+import sys
+import threading
+
+from fastapi import HTTPException
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import SessionStore, append_message, get_session, get_sessions, sessions
+
+
+def check_consistent(session):
+    """A session is "processing" exactly when its last message is an unanswered user message"""
+    messages = session["messages"]
+    assert (session["status"] == "processing") == (len(messages) % 2 == 1)
+    assert all(message["type"] == ("user" if i % 2 == 0 else "assistant") for i, message in enumerate(messages))
+
+
+def test_concurrent_reads_see_consistent_snapshots():
+    session_ids = [f"stress-{i}" for i in range(10)]
+    stop = threading.Event()
+    errors = []
+    reads = [0]
+
+    def reader():
+        try:
+            while not stop.is_set():
+                for info in get_sessions(user_email="stress@example.com"):
+                    assert info.status in ("processing", "completed")
+                for session_id in session_ids:
+                    try:
+                        check_consistent(get_session(session_id, limit=None, cursor=None, attachments="inline"))
+                    except HTTPException as e:
+                        assert e.status_code == 404  # deleted by the writer
+                for snapshot in sessions.snapshot_all():
+                    if snapshot["session_id"].startswith("stress-"):
+                        check_consistent(snapshot)
+                reads[0] += 1
+        except Exception as e:  # surfaced to the main thread below
+            errors.append(e)
+
+    async def writer():
+        for round_number in range(100):
+            for session_id in session_ids:
+                sessions.create(session_id, title="stress", user_email="stress@example.com",
+                                created_at="", last_activity="", status="completed")
+                append_message(session_id, {"type": "user", "content": f"q{round_number}", "timestamp": ""},
+                               status="processing", last_activity=str(round_number))
+            await asyncio.sleep(0)
+            for session_id in session_ids:
+                append_message(session_id, {"type": "assistant", "content": f"a{round_number}", "timestamp": ""},
+                               status="completed", last_activity=str(round_number))
+            if round_number % 10 == 0:
+                sessions.delete(session_ids[round_number % len(session_ids)])
+            await asyncio.sleep(0)
+
+    threads = [threading.Thread(target=reader) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    try:
+        asyncio.run(writer())
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    assert not errors, errors[0]
+    assert reads[0] > 0
+    for session_id in session_ids:
+        sessions.delete(session_id)
+
+
+def test_concurrent_writers_do_not_lose_messages():
+    store = SessionStore()
+    store.create("shared", title="t", created_at="", last_activity="", status="processing")
+
+    def write(worker):
+        for i in range(500):
+            store.append_message("shared", {"type": "user", "content": f"{worker}-{i}"})
+
+    threads = [threading.Thread(target=write, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(store["shared"]["messages"]) == 8 * 500
+
+
+def test_snapshots_are_read_only_and_stable():
+    store = SessionStore()
+    store.create("s", title="t", user_email="u", created_at="", last_activity="1", status="processing")
+    before = store["s"]
+
+    store.append_message("s", {"type": "user", "content": "hi"}, status="completed", last_activity="2")
+
+    assert before["messages"] == () and before["status"] == "processing"
+    assert len(store["s"]["messages"]) == 1
+    try:
+        before["status"] = "error"
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("snapshot should be read-only")
+    assert store.delete("s") is not None
+    assert store.update("s", status="error") is None
+    assert store.sessions_for_user("u") == []
@@ -0,0 +1,60 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import (
+    ProgressLogger,
+    StepDelayProfile,
+    VirtualClock,
+    run_capacity_simulation,
+    simulate_analysis_with_progress,
+)
+
+
+def test_simulation_runs_on_virtual_time():
+    """The default pipeline should take its 2.5s critical path and log 7 entries."""
+    clock = VirtualClock()
+    logger = ProgressLogger(logs_dir=None, clock=clock)
+
+    clock.run(simulate_analysis_with_progress("virtual-session", "show me a chart", "chart", logger=logger))
+
+    assert clock.time() == 2.5
+    logs = logger.get_progress_logs("virtual-session")
+    assert [log["step"] for log in logs][-1] == "Completed"
+    assert len(logs) == 7
+    # Timestamps come from the injected clock
+    assert logs[0]["timestamp"] == clock.start.isoformat()
+
+
+def test_step_delay_profile_overrides():
+    clock = VirtualClock()
+    logger = ProgressLogger(logs_dir=None, clock=clock)
+    delays = StepDelayProfile(default=0.1, overrides={"Executing code": 2.0})
+
+    clock.run(simulate_analysis_with_progress("s", "q", "text", logger=logger, delays=delays))
+
+    assert abs(clock.time() - 2.4) < 1e-9
+
+
+def test_step_delay_profile_jitter_is_seeded():
+    first = StepDelayProfile(default=1.0, jitter=0.2, seed=7)
+    second = StepDelayProfile(default=1.0, jitter=0.2, seed=7)
+    samples = [first.delay_for("Analyzing") for _ in range(10)]
+
+    assert samples == [second.delay_for("Analyzing") for _ in range(10)]
+    assert all(0.8 <= sample <= 1.2 for sample in samples)
+
+
+def test_capacity_simulation_is_deterministic():
+    clock = VirtualClock()
+    stats = clock.run(run_capacity_simulation(2000, clock, arrival_interval=0.01))
+
+    assert stats["sessions"] == 2000
+    assert stats["entries_logged"] == 2000 * 7
+    assert abs(stats["latency_max"] - 2.5) < 1e-6
+    assert abs(stats["virtual_seconds"] - (2000 * 0.01 + 2.5 - 0.01)) < 1e-6
+    # 2.5s of work arriving every 10ms keeps ~250 sessions in flight
+    assert 245 <= stats["peak_concurrent_sessions"] <= 255
+    # Each simulated session should cost well under a millisecond of wall time
+    assert stats["wall_seconds"] < 3
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import os
+import sys
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import app, progress_logger, sessions
+
+
+def log_steps(session_id, *steps):
+    for step in steps:
+        asyncio.run(progress_logger.log_progress(session_id, step, f"{step}...", 1, 6))
+
+
+@pytest.fixture
+def client():
+    # Start each session from a clean slate
+    for session_id in ("ws-finished", "ws-idle", "ws-limited", "ws-batch", "ws-single", "ws-follow-up"):
+        progress_logger.delete_logs(session_id)
+        sessions.delete(session_id)
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def test_finished_session_closes_after_replay(client):
+    log_steps("ws-finished", "Starting", "Completed", "Finished")
+
+    with client.websocket_connect("/ws/progress/ws-finished") as ws:
+        steps = [json.loads(ws.receive_text())["step"] for _ in range(3)]
+        assert steps == ["Starting", "Completed", "Finished"]
+        assert ws.receive()["type"] == "websocket.close"
+
+    assert "ws-finished" not in progress_logger.active_connections
+
+
+def test_queued_follow_up_keeps_connection_open(client):
+    # The first job finished; a follow-up in the same session is still queued
+    log_steps("ws-follow-up", "Starting", "Finished")
+    sessions.create("ws-follow-up", title="t", user_email="a@example.com", created_at="2024-01-01T00:00:00",
+                    last_activity="2024-01-01T00:00:00", status="processing")
+
+    with client.websocket_connect("/ws/progress/ws-follow-up") as ws:
+        assert [json.loads(ws.receive_text())["step"] for _ in range(2)] == ["Starting", "Finished"]
+        client.portal.call(progress_logger.log_progress, "ws-follow-up", "Starting", "Starting...", 0, 6)
+        assert json.loads(ws.receive_text())["step"] == "Starting"
+
+
+def test_unresponsive_client_is_reaped(client, monkeypatch):
+    monkeypatch.setattr(app_module, "WS_PING_INTERVAL", 0.05)
+    monkeypatch.setattr(app_module, "WS_PONG_TIMEOUT", 0.05)
+    log_steps("ws-idle", "Starting")
+
+    with client.websocket_connect("/ws/progress/ws-idle") as ws:
+        assert json.loads(ws.receive_text())["step"] == "Starting"
+        assert json.loads(ws.receive_text())["type"] == "ping"
+        # Never answer - the server gives up after interval + timeout
+        message = ws.receive()
+        while message["type"] == "websocket.send":
+            message = ws.receive()
+        assert message == {"type": "websocket.close", "code": 1001, "reason": "Heartbeat timeout"}
+
+    deadline = time.time() + 1
+    while "ws-idle" in progress_logger.active_connections and time.time() < deadline:
+        time.sleep(0.01)
+    assert "ws-idle" not in progress_logger.active_connections
+
+
+def test_per_session_connection_limit(client, monkeypatch):
+    monkeypatch.setattr(app_module, "WS_MAX_CONNECTIONS_PER_SESSION", 1)
+    log_steps("ws-limited", "Starting")
+
+    with client.websocket_connect("/ws/progress/ws-limited") as first:
+        assert json.loads(first.receive_text())["step"] == "Starting"
+        with client.websocket_connect("/ws/progress/ws-limited") as second:
+            message = second.receive()
+            assert message["type"] == "websocket.close"
+            assert message["code"] == 1013
+        assert progress_logger.connection_count() == 1
+
+
+def test_batch_framing_coalesces_replay_and_live_entries(client):
+    log_steps("ws-batch", "Starting", "Scanning databases")
+
+    with client.websocket_connect("/ws/progress/ws-batch?framing=batch&batch_window_ms=50") as ws:
+        replay = json.loads(ws.receive_text())
+        assert [entry["step"] for entry in replay] == ["Starting", "Scanning databases"]
+
+        for step in ("Analyzing", "Fetching relevant data", "Writing code"):
+            client.portal.call(progress_logger.log_progress, "ws-batch", step, f"{step}...", 2, 6)
+        live = json.loads(ws.receive_text())
+        assert [entry["step"] for entry in live] == ["Analyzing", "Fetching relevant data", "Writing code"]
+
+        # Pending entries are flushed before the close-on-complete
+        client.portal.call(progress_logger.log_progress, "ws-batch", "Finished", "Done", 6, 6)
+        assert [entry["step"] for entry in json.loads(ws.receive_text())] == ["Finished"]
+        assert ws.receive()["type"] == "websocket.close"
+
+
+def test_single_framing_is_the_default(client):
+    log_steps("ws-single", "Starting", "Scanning databases")
+
+    with client.websocket_connect("/ws/progress/ws-single") as ws:
+        assert json.loads(ws.receive_text())["step"] == "Starting"
+        assert json.loads(ws.receive_text())["step"] == "Scanning databases"
+
+
+def test_unknown_framing_is_rejected(client):
+    with client.websocket_connect("/ws/progress/ws-bad?framing=msgpack") as ws:
+        assert ws.receive()["code"] == 1008
@@ -3,7 +3,7 @@ import MessageList from './MessageList'
 import FileUpload from './FileUpload'
 import ProgressMessage from './ProgressMessage'
 import { Send, Paperclip } from 'lucide-react'
-import { sendQuery, getSession } from '../services/api'
+import { sendQuery, getSession, CURRENT_USER_EMAIL } from '../services/api'
 
 function ChatArea({ sessionId, onSessionCreated }) {
   const [messages, setMessages] = useState([])
@@ -13,6 +13,7 @@ function ChatArea({ sessionId, onSessionCreated }) {
   const [showProgressMessage, setShowProgressMessage] = useState(false)
   const [currentSessionId, setCurrentSessionId] = useState(sessionId)
   const [processingSessionId, setProcessingSessionId] = useState(null)
+  const [uploadedFileId, setUploadedFileId] = useState(null)
 
   useEffect(() => {
     if (sessionId) {
@@ -24,6 +25,9 @@ function ChatArea({ sessionId, onSessionCreated }) {
     }
     setShowProgressMessage(false) // Reset progress message when switching sessions
     setProcessingSessionId(null)
+    if (sessionId !== currentSessionId) {
+      setUploadedFileId(null) // Keep the file when the parent selects the session we just created
+    }
   }, [sessionId])
 
   const loadSession = async () => {
@@ -52,8 +56,9 @@ function ChatArea({ sessionId, onSessionCreated }) {
     try {
       const response = await sendQuery(
         userMessage.content,
-        'demo@example.com',
-        sessionId
+        CURRENT_USER_EMAIL,
+        sessionId,
+        uploadedFileId // Questions are answered from the last uploaded file
       )
 
       // Update current session ID for new sessions
@@ -136,6 +141,8 @@ function ChatArea({ sessionId, onSessionCreated }) {
       file_info: fileInfo
     }
     setMessages(prev => [...prev, fileMessage])
+    // Only CSV uploads can be analyzed - after any other file, answer without one
+    setUploadedFileId(fileInfo.analyzable ? fileInfo.file_id : null)
     setShowFileUpload(false)
   }
 
@@ -26,6 +26,13 @@ function ProgressLogger({ sessionId, isVisible, onComplete }) {
         wsRef.current.onmessage = (event) => {
           try {
             const logEntry = JSON.parse(event.data)
+
+            // Answer server heartbeats so the connection isn't reaped as idle
+            if (logEntry.type === 'ping') {
+              wsRef.current?.send(JSON.stringify({ type: 'pong' }))
+              return
+            }
+
             setLogs(prevLogs => {
               // Avoid duplicates based on timestamp and step
               const exists = prevLogs.some(log => 
@@ -29,6 +29,12 @@ function ProgressMessage({ sessionId, onComplete }) {
           try {
             const logEntry = JSON.parse(event.data)
             
+            // Answer server heartbeats so the connection isn't reaped as idle
+            if (logEntry.type === 'ping') {
+              wsRef.current?.send(JSON.stringify({ type: 'pong' }))
+              return
+            }
+            
             setLogs(prevLogs => {
               // Avoid duplicates
               const exists = prevLogs.some(log => 
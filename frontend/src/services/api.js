@@ -34,12 +34,16 @@ api.interceptors.response.use(
   }
 )
 
-export const sendQuery = async (userQuery, userEmail, sessionId = null) => {
+// The demo has no sign-in - every query and session listing is made as this user
+export const CURRENT_USER_EMAIL = 'demo@example.com'
+
+export const sendQuery = async (userQuery, userEmail, sessionId = null, fileId = null) => {
   try {
     const response = await api.post('/query', {
       user_query: userQuery,
       user_email: userEmail,
-      session_id: sessionId
+      session_id: sessionId,
+      file_id: fileId
     })
     return response.data
   } catch (error) {
@@ -48,9 +52,11 @@ export const sendQuery = async (userQuery, userEmail, sessionId = null) => {
   }
 }
 
-export const getSessions = async () => {
+export const getSessions = async (userEmail = CURRENT_USER_EMAIL) => {
   try {
-    const response = await api.get('/sessions')
+    const response = await api.get('/sessions', {
+      params: { user_email: userEmail }
+    })
     return response.data
   } catch (error) {
     console.error('Failed to get sessions:', error)